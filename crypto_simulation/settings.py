@@ -71,6 +71,34 @@ CHANNEL_LAYERS = {
     },
 }
 
+# Shared between the rabbit listener and the web/ASGI processes
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.getenv("REDIS_URL", "redis://localhost:6379/0"),
+    },
+}
+
+# How many recent candles per symbol/interval a WebSocket client gets on subscribe
+PRICE_SNAPSHOT_CANDLES = int(os.getenv("PRICE_SNAPSHOT_CANDLES", "100"))
+
+# Bets are placed at the listener's latest price; refuse it once it is older
+# than this many seconds (0 — accept any age)
+ENTRY_PRICE_MAX_AGE = float(os.getenv("ENTRY_PRICE_MAX_AGE", "10"))
+# Most bets accepted by one /api/bets/place-batch/ request
+BET_BATCH_MAX = int(os.getenv("BET_BATCH_MAX", "100"))
+
+# Expired bets settled per transaction by process_bets
+SETTLEMENT_BATCH_SIZE = int(os.getenv("SETTLEMENT_BATCH_SIZE", "1000"))
+# Bets are settled at the last tick at or before expiry; wait this many seconds
+# after expiry so the ticks up to it have been written
+SETTLEMENT_DELAY = float(os.getenv("SETTLEMENT_DELAY", "2"))
+# How often the settlement scheduler sweeps the table for bets it missed
+SETTLEMENT_RESYNC = float(os.getenv("SETTLEMENT_RESYNC", "60"))
+# process_bets fans out one settle_partition task per user_id % partitions
+# (databases without SKIP LOCKED, such as SQLite, always use one)
+SETTLEMENT_PARTITIONS = int(os.getenv("SETTLEMENT_PARTITIONS", "4"))
+
 
 CELERY_BEAT_SCHEDULER = 'django_celery_beat.schedulers:DatabaseScheduler'
 CELERY_BROKER_URL = os.getenv("CELERY_BROKER_URL")
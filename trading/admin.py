@@ -3,8 +3,8 @@ from .models import Candle, UserProfile, Bet, ChartType
 
 @admin.register(Candle)
 class CandleAdmin(admin.ModelAdmin):
-    list_display = ('time', 'open_price', 'close_price', 'min_price', 'max_price')
-    list_filter = ('time',)
+    list_display = ('time', 'interval', 'open_price', 'close_price', 'min_price', 'max_price')
+    list_filter = ('interval', 'time')
     search_fields = ('time',)
 
 @admin.register(UserProfile)
@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class TradingConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "trading"
+
+    def ready(self):
+        from . import registry  # noqa: F401 - connects ChartType cache signals
+        from . import scheduler  # noqa: F401 - hands placed bets to the settlement scheduler
+        from . import httpcache  # noqa: F401 - versions cached candle/chart-type responses
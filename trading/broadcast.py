@@ -0,0 +1,110 @@
+import re
+import time
+
+from asgiref.sync import async_to_sync
+
+from .metrics import recorder
+from .snapshots import arecord_prices, record_prices
+
+# Events without a symbol still go to every connected PriceConsumer
+PRICES_GROUP = "prices"
+
+
+def price_group(symbol):
+    """Channel group of one symbol, e.g. `prices.BTC-USD`."""
+    # Group names may only contain ASCII letters, digits, '-', '_' and '.'
+    return f"{PRICES_GROUP}.{re.sub(r'[^A-Za-z0-9_.-]', '_', symbol)}"
+
+
+class PriceBroadcaster:
+    """
+    Publishes listener ticks to the per-symbol `prices.<symbol>` groups.
+
+    With `rate` = 0 every tick is sent as it arrives (`send_price`). Otherwise
+    only the latest tick per symbol is kept and flushed as a `send_prices`
+    frame at most `rate` times a second, so the fan-out cost follows the flush
+    rate instead of the tick rate.
+    """
+
+    def __init__(self, channel_layer, rate=0):
+        self.channel_layer = channel_layer
+        self.rate = rate
+        self.period = 1 / rate if rate else 0
+        self.latest = {}  # symbol → (newest tick, its stamps, newest stored tick)
+        self.last_flush = time.monotonic()
+
+    def _offer(self, data):
+        """Returns (group, event, stored) to send right away, or None if the tick was conflated."""
+        symbol = data.get("chart_type")
+        lat = data.pop("_lat", None)
+        # Only ticks the listener accepted and wrote become the latest price
+        stored = data.pop("_stored", False)
+        if not symbol:
+            return PRICES_GROUP, {"type": "send_price", "data": data, "lat": lat}, False
+        if not self.rate:
+            return price_group(symbol), {"type": "send_price", "data": data, "lat": lat}, stored
+        previous = self.latest.get(symbol)
+        # A rejected tick still goes out, but must not hide the stored one before it
+        latest_stored = data if stored else (previous[2] if previous else None)
+        self.latest[symbol] = (data, lat, latest_stored)
+        return None
+
+    def _take(self):
+        """Conflated sends, and the latest stored tick of each symbol to cache."""
+        self.last_flush = time.monotonic()
+        latest, self.latest = self.latest, {}
+        sends = [
+            (price_group(symbol), {"type": "send_prices", "data": [data], "lat": lat})
+            for symbol, (data, lat, _) in latest.items()
+        ]
+        return sends, [stored for _, _, stored in latest.values() if stored is not None]
+
+    @staticmethod
+    def _sent(event):
+        data = event["data"]
+        symbol = (data[-1] if isinstance(data, list) else data).get("chart_type")
+        recorder.since(event["lat"], "publish", "written", symbol)
+
+    def time_left(self):
+        if not self.rate:
+            return None
+        return max(0.0, self.period - (time.monotonic() - self.last_flush))
+
+    def publish(self, data):
+        send = self._offer(data)
+        if send is not None:
+            group, event, stored = send
+            if stored:
+                record_prices([data])
+            async_to_sync(self.channel_layer.group_send)(group, event)
+            self._sent(event)
+        elif self.time_left() == 0:
+            self.flush()
+
+    def flush(self):
+        sends, stored = self._take()
+        if stored:
+            record_prices(stored)
+        if sends:
+            async_to_sync(self._send_all)(sends)
+
+    async def apublish(self, data):
+        send = self._offer(data)
+        if send is not None:
+            group, event, stored = send
+            if stored:
+                await arecord_prices([data])
+            await self.channel_layer.group_send(group, event)
+            self._sent(event)
+
+    async def aflush(self):
+        sends, stored = self._take()
+        if stored:
+            await arecord_prices(stored)
+        if sends:
+            await self._send_all(sends)
+
+    async def _send_all(self, sends):
+        for group, event in sends:
+            await self.channel_layer.group_send(group, event)
+            self._sent(event)
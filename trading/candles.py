@@ -0,0 +1,346 @@
+import re
+from datetime import datetime, timezone as dt_timezone
+
+from django.db import transaction
+
+try:
+    import numpy as np
+except ImportError:  # columnar candles fall back to the streaming pass
+    np = None
+
+from .models import Candle, CandleCheckpoint, PriceStamp
+from .registry import chart_types
+
+# '5s' → 5, '1m' → 60, ...
+INTERVALS = {label: seconds for seconds, label in Candle.INTERVAL_CHOICES}
+
+
+def bucket_start(ts, interval):
+    """Start of the wall-clock aligned bucket of `interval` seconds containing `ts`."""
+    epoch = int(ts.timestamp())
+    return datetime.fromtimestamp(epoch - epoch % interval, tz=dt_timezone.utc)
+
+
+class OpenCandle:
+    __slots__ = ('start', 'open', 'high', 'low', 'close')
+
+    def __init__(self, start, price):
+        self.start = start
+        self.open = self.high = self.low = self.close = price
+
+    def add(self, price):
+        if price > self.high:
+            self.high = price
+        if price < self.low:
+            self.low = price
+        self.close = price
+
+    def copy(self):
+        other = OpenCandle(self.start, self.open)
+        other.high, other.low, other.close = self.high, self.low, self.close
+        return other
+
+    def to_candle(self, chart, interval):
+        return Candle(
+            chart_type=chart,
+            interval=interval,
+            time=self.start,
+            open_price=self.open,
+            close_price=self.close,
+            min_price=self.low,
+            max_price=self.high,
+        )
+
+
+class CandleRollup:
+    """
+    Incremental OHLC builder for every persisted resolution.
+
+    Keeps one open bucket per (symbol, interval). A bucket is closed, and
+    returned as an unsaved Candle, when a tick from a later window arrives or
+    when `close_expired` is called after its window has ended.
+    """
+
+    def __init__(self, intervals=None):
+        self.intervals = tuple(intervals or INTERVALS.values())
+        self.open = {}  # (symbol, interval) → (chart, OpenCandle)
+        self.closed_until = {}  # (symbol, interval) → end of the last closed bucket
+        self.last_tick = {}  # symbol → time of the newest tick folded in
+
+    def add(self, chart, price, ts):
+        price = float(price)
+        closed = []
+        self.last_tick[chart.symbol] = ts
+        for interval in self.intervals:
+            key = (chart.symbol, interval)
+            start = bucket_start(ts, interval)
+
+            # Late tick for a window that has already been written
+            if key in self.closed_until and start < self.closed_until[key]:
+                continue
+
+            current = self.open.get(key)
+            if current is not None and current[1].start == start:
+                current[1].add(price)
+                continue
+            if current is not None:
+                closed.append(self._close(key))
+            self.open[key] = (chart, OpenCandle(start, price))
+        return closed
+
+    def close_expired(self, now):
+        """Close every bucket whose window ended before `now`."""
+        expired = [
+            key for key, (_, candle) in self.open.items()
+            if candle.start.timestamp() + key[1] <= now.timestamp()
+        ]
+        return [self._close(key) for key in expired]
+
+    def _close(self, key):
+        chart, candle = self.open.pop(key)
+        interval = key[1]
+        self.closed_until[key] = datetime.fromtimestamp(
+            candle.start.timestamp() + interval, tz=dt_timezone.utc
+        )
+        return candle.to_candle(chart, interval)
+
+    def forget(self, symbols):
+        """Drop all state of `symbols`, e.g. of chart types deleted meanwhile."""
+        symbols = set(symbols)
+        for state in (self.open, self.closed_until):
+            for key in [key for key in state if key[0] in symbols]:
+                del state[key]
+        for symbol in symbols:
+            self.last_tick.pop(symbol, None)
+
+    def snapshot(self):
+        return (
+            {key: (chart, candle.copy()) for key, (chart, candle) in self.open.items()},
+            dict(self.closed_until),
+            dict(self.last_tick),
+        )
+
+    def restore(self, state):
+        self.open, self.closed_until, self.last_tick = state
+
+
+def save_candles(candles):
+    # Replayed ticks may close a bucket that was already written before a restart
+    Candle.objects.bulk_create(candles, ignore_conflicts=True)
+    if candles:
+        from .snapshots import record_candles
+        transaction.on_commit(lambda: record_candles(candles))
+
+
+def save_checkpoint(rollup):
+    """Persist the open buckets of `rollup`, replacing the previous checkpoint."""
+    rows = [
+        CandleCheckpoint(
+            chart_type=chart,
+            interval=interval,
+            time=candle.start,
+            open_price=candle.open,
+            close_price=candle.close,
+            min_price=candle.low,
+            max_price=candle.high,
+            last_tick=rollup.last_tick[symbol],
+        )
+        for (symbol, interval), (chart, candle) in rollup.open.items()
+    ]
+    with transaction.atomic():
+        # Only the symbols this rollup owns, other listener shards keep theirs
+        CandleCheckpoint.objects.filter(chart_type__symbol__in=list(rollup.last_tick)).delete()
+        CandleCheckpoint.objects.bulk_create(rows)
+
+
+def restore_rollup(rollup, now, charts=None):
+    """
+    Rebuild the open buckets of `charts` (all chart types by default) after a restart.
+
+    Buckets are loaded from the last checkpoint and then brought up to date by
+    replaying only the PriceStamps written after it. Without a checkpoint the
+    current buckets are derived from the ticks since the start of the longest
+    window. Returns the candles whose window ended while the listener was down.
+    """
+    checkpoints = {}
+    for row in CandleCheckpoint.objects.all():
+        checkpoints.setdefault(row.chart_type_id, []).append(row)
+
+    longest = max(rollup.intervals)
+    for chart in chart_types.all() if charts is None else charts:
+        rows = checkpoints.get(chart.id)
+        if rows:
+            for row in rows:
+                key = (chart.symbol, row.interval)
+                candle = OpenCandle(row.time, row.open_price)
+                candle.high, candle.low, candle.close = row.max_price, row.min_price, row.close_price
+                rollup.open[key] = (chart, candle)
+                rollup.closed_until[key] = row.time
+            since = min(row.last_tick for row in rows)
+            rollup.last_tick[chart.symbol] = since
+        else:
+            for interval in rollup.intervals:
+                last = Candle.objects.filter(
+                    chart_type=chart, interval=interval
+                ).order_by('-time').values_list('time', flat=True).first()
+                if last is not None:
+                    rollup.closed_until[(chart.symbol, interval)] = datetime.fromtimestamp(
+                        last.timestamp() + interval, tz=dt_timezone.utc
+                    )
+            since = bucket_start(now, longest)
+
+        ticks = PriceStamp.objects.filter(
+            chart_type=chart, time__gt=since
+        ).order_by('time').values_list('price', 'time')
+        closed = []
+        for price, ts in ticks.iterator(chunk_size=2000):
+            closed.extend(rollup.add(chart, price, ts))
+        save_candles(closed)
+
+    return rollup.close_expired(now)
+
+
+UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+# Widest interval served; keeps bucket arithmetic within datetime's range
+MAX_INTERVAL = 52 * UNITS['w']
+
+
+def parse_interval(value):
+    """'15m', '4h', '1w' or plain seconds → seconds; ValueError if unusable."""
+    match = re.fullmatch(r'(\d+)([smhdw]?)', value.strip())
+    if not match:
+        raise ValueError(f"Invalid interval {value!r}")
+    seconds = int(match.group(1)) * UNITS[match.group(2) or 's']
+    if not seconds or seconds % min(INTERVALS.values()):
+        raise ValueError(f"Interval must be a positive multiple of {min(INTERVALS.values())}s")
+    if seconds > MAX_INTERVAL:
+        raise ValueError(f"Interval must be at most {MAX_INTERVAL // UNITS['w']}w")
+    return seconds
+
+
+def base_interval(seconds):
+    """Largest stored interval that `seconds` is a multiple of."""
+    return max(stored for stored in INTERVALS.values() if seconds % stored == 0)
+
+
+def candle_rows(chart_type_id, interval, end, limit, start=None):
+    """
+    Stored candles that make up the newest `limit` candles of `interval`
+    seconds with buckets in [start, end), oldest first, as
+    (time, open, close, min, max).
+
+    They come from the largest stored interval dividing `interval`. A bucket
+    holds at most `interval // base` of those, so the newest `limit` buckets
+    are among that many times `limit` rows: one bounded scan of the
+    (chart_type, interval, time) index, however wide the gaps between them.
+    Rows of an older, partly read bucket are dropped.
+    """
+    base = base_interval(interval)
+    candles = Candle.objects.filter(chart_type_id=chart_type_id, interval=base, time__lt=end)
+    if start is not None:
+        candles = candles.filter(time__gte=start)
+    rows = list(
+        candles.order_by('-time')
+        .values_list('time', 'open_price', 'close_price', 'min_price', 'max_price')[:limit * (interval // base)]
+    )
+
+    buckets = 0
+    previous = None
+    for kept, row in enumerate(rows):
+        epoch = int(row[0].timestamp())
+        bucket = epoch - epoch % interval
+        if bucket != previous:
+            if buckets == limit:
+                del rows[kept:]
+                break
+            buckets += 1
+            previous = bucket
+    rows.reverse()
+    return rows
+
+
+def query_candles(chart_type_id, interval, end, limit, start=None):
+    """
+    The newest `limit` candles of `interval` seconds with buckets in
+    [start, end), newest first, as unsaved Candle objects.
+
+    Stored intervals come straight from the table, with their ids. Any other
+    multiple of 5 seconds is built by folding the rows of `candle_rows` into
+    the wider buckets in a single pass; buckets are epoch-aligned like the
+    stored ones.
+    """
+    if interval in INTERVALS.values():
+        candles = Candle.objects.filter(chart_type_id=chart_type_id, interval=interval, time__lt=end)
+        if start is not None:
+            candles = candles.filter(time__gte=start)
+        return list(candles.order_by('-time')[:limit])
+
+    candles = []
+    current = None
+    for time, open_price, close_price, min_price, max_price in candle_rows(
+        chart_type_id, interval, end, limit, start
+    ):
+        epoch = int(time.timestamp())
+        bucket = epoch - epoch % interval
+        if current is None or current.time != bucket:
+            current = Candle(
+                chart_type_id=chart_type_id, interval=interval, time=bucket,
+                open_price=open_price, close_price=close_price,
+                min_price=min_price, max_price=max_price,
+            )
+            candles.append(current)
+            continue
+        current.close_price = close_price
+        if min_price < current.min_price:
+            current.min_price = min_price
+        if max_price > current.max_price:
+            current.max_price = max_price
+
+    for candle in candles:
+        candle.time = datetime.fromtimestamp(candle.time, tz=dt_timezone.utc)
+    candles.reverse()
+    return candles
+
+
+def query_candle_columns(chart_type_id, interval, end, limit, start=None):
+    """
+    Same candles as `query_candles`, oldest first, as parallel lists:
+    {'time': [epoch seconds], 'open': [...], 'high': [...], 'low': [...],
+    'close': [...]}.
+
+    The rows come from `candle_rows`, which selects the newest `limit`
+    candles for stored intervals too. With NumPy they are bucketed in
+    vectorized form (`reduceat` over the bucket boundaries) and no
+    per-candle objects are built; without it the streaming pass of
+    `query_candles` is used.
+    """
+    if np is None:
+        candles = query_candles(chart_type_id, interval, end, limit, start)[::-1]
+        return {
+            'time': [int(c.time.timestamp()) for c in candles],
+            'open': [c.open_price for c in candles],
+            'high': [c.max_price for c in candles],
+            'low': [c.min_price for c in candles],
+            'close': [c.close_price for c in candles],
+        }
+
+    rows = candle_rows(chart_type_id, interval, end, limit, start)
+    if not rows:
+        return {'time': [], 'open': [], 'high': [], 'low': [], 'close': []}
+    times, opens, closes, lows, highs = zip(*rows)
+
+    epochs = np.fromiter((t.timestamp() for t in times), dtype=np.int64, count=len(times))
+    buckets = epochs - epochs % interval
+    # reduceat runs from each bucket's first row to the next bucket's
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    ends = np.r_[starts[1:], len(epochs)] - 1
+
+    opens = np.asarray(opens, dtype=np.float64)
+    closes = np.asarray(closes, dtype=np.float64)
+    return {
+        'time': buckets[starts].tolist(),
+        'open': opens[starts].tolist(),
+        'high': np.maximum.reduceat(np.asarray(highs, dtype=np.float64), starts).tolist(),
+        'low': np.minimum.reduceat(np.asarray(lows, dtype=np.float64), starts).tolist(),
+        'close': closes[ends].tolist(),
+    }
@@ -1,8 +1,17 @@
+from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.layers import get_channel_layer
+from urllib.parse import parse_qs
 import json
 import logging
 
+from .broadcast import PRICES_GROUP, price_group
+from .candles import INTERVALS
+from .encoding import COMPACT_ENCODING, DeltaEncoder
+from .metrics import recorder
+from .registry import chart_types
+from .snapshots import get_snapshot
+
 logger = logging.getLogger(__name__)
 
 # class PriceConsumer(AsyncWebsocketConsumer):
@@ -66,14 +75,129 @@ class RandomConsumer(AsyncWebsocketConsumer):
 
 
 class PriceConsumer(AsyncWebsocketConsumer):
+    """
+    Streams ticks for the symbols the client is subscribed to.
+
+    Symbols can be given on connect (`ws/prices/?symbols=BTC-USD,ETH-USD`),
+    otherwise the client starts subscribed to every chart type. The set is
+    changed with `{"action": "subscribe" | "unsubscribe", "symbols": [...]}`,
+    where `"*"` means all symbols; each change is answered with the current
+    subscriptions. Every newly subscribed symbol first gets a `snapshot` frame
+    with its recent candles (`?interval=`, 5s by default) and latest tick.
+
+    Clients that ask for the `msgpack` subprotocol (or `?encoding=msgpack`)
+    get binary msgpack frames with delta-encoded ticks, see DeltaEncoder.
+    """
+
     async def connect(self):
-        await self.channel_layer.group_add("prices", self.channel_name)
-        await self.accept()
+        self.symbols = set()
+        await self.channel_layer.group_add(PRICES_GROUP, self.channel_name)
+
+        query = parse_qs(self.scope.get("query_string", b"").decode())
+        self.interval = INTERVALS.get(query.get("interval", ["5s"])[0], INTERVALS["5s"])
+        requested = [s for value in query.get("symbols", []) for s in value.split(",") if s]
+        added = await self.subscribe(requested or ["*"])
+
+        subprotocol = COMPACT_ENCODING if COMPACT_ENCODING in self.scope.get("subprotocols", []) else None
+        compact = subprotocol or query.get("encoding", [""])[0] == COMPACT_ENCODING
+        self.encoder = DeltaEncoder() if compact else None
+
+        await self.accept(subprotocol=subprotocol)
+        await self.send_snapshots(added)
         print("websocket connection established")
 
     async def disconnect(self, close_code):
-        await self.channel_layer.group_discard("prices", self.channel_name)
+        await self.channel_layer.group_discard(PRICES_GROUP, self.channel_name)
+        for symbol in self.symbols:
+            await self.channel_layer.group_discard(price_group(symbol), self.channel_name)
+
+    async def receive(self, text_data=None, bytes_data=None):
+        try:
+            if bytes_data is not None and self.encoder:
+                message = self.encoder.unpack(bytes_data)
+            else:
+                message = json.loads(text_data or bytes_data)
+            action = message["action"]
+            symbols = message.get("symbols", [])
+        except (ValueError, TypeError, KeyError):
+            await self.send_frame({"type": "error", "error": "Invalid message"})
+            return
+
+        if isinstance(symbols, str):
+            symbols = [symbols]
+        symbols = [s for s in symbols if isinstance(s, str)] if isinstance(symbols, list) else []
+
+        added = []
+        unknown = []
+        if action == "subscribe":
+            known = await get_symbols()
+            unknown = sorted(set(symbols) - known - {"*"})
+            added = await self.subscribe(symbols, known)
+        elif action == "unsubscribe":
+            await self.unsubscribe(symbols)
+        else:
+            await self.send_frame({"type": "error", "error": f"Unknown action: {action}"})
+            return
+
+        await self.send_frame({
+            "type": "subscriptions",
+            "symbols": sorted(self.symbols),
+            "unknown": unknown,
+        })
+        await self.send_snapshots(added)
+
+    async def subscribe(self, symbols, known=None):
+        """Join the groups of `symbols`, returns the ones that were newly added."""
+        if known is None:
+            known = await get_symbols()
+        if "*" in symbols:
+            symbols = known
+        added = sorted((set(symbols) & known) - self.symbols)
+        for symbol in added:
+            await self.channel_layer.group_add(price_group(symbol), self.channel_name)
+            self.symbols.add(symbol)
+        return added
+
+    async def unsubscribe(self, symbols):
+        if "*" in symbols:
+            symbols = set(self.symbols)
+        for symbol in set(symbols) & self.symbols:
+            await self.channel_layer.group_discard(price_group(symbol), self.channel_name)
+            self.symbols.discard(symbol)
+
+    async def send_frame(self, payload):
+        if self.encoder:
+            await self.send(bytes_data=self.encoder.pack(payload))
+        else:
+            await self.send(text_data=json.dumps(payload))
+
+    async def send_snapshots(self, symbols):
+        for symbol in symbols:
+            snapshot = await get_snapshot(symbol, self.interval)
+            if self.encoder:
+                snapshot["sid"] = self.encoder.sid(symbol)
+                self.encoder.reset(symbol)
+            await self.send_frame(snapshot)
 
     async def send_price(self, event):
-        await self.send(text_data=json.dumps(event["data"]))
+        data = event["data"]
+        await self.send_frame(self.encoder.tick(data) if self.encoder else data)
+        await self.delivered(event, data.get("chart_type"))
+
+    async def send_prices(self, event):
+        # Conflated frame: latest tick of the subscribed symbol since the last flush
+        data = event["data"]
+        await self.send_frame([self.encoder.tick(d) for d in data] if self.encoder else data)
+        await self.delivered(event, data[-1].get("chart_type") if data else None)
+
+    async def delivered(self, event, symbol):
+        lat = event.get("lat")
+        if lat:
+            recorder.since(lat, "deliver", "written", symbol)
+            recorder.since(lat, "total", "recv", symbol)
+            await recorder.apublish_if_due()
+
 
+@database_sync_to_async
+def get_symbols():
+    return {chart.symbol for chart in chart_types.all()}
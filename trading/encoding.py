@@ -0,0 +1,59 @@
+from decimal import Decimal, InvalidOperation
+
+import msgpack
+
+# WebSocket subprotocol (or `?encoding=` value) that selects the compact frames
+COMPACT_ENCODING = "msgpack"
+
+# Prices are sent as integers of 1e-8, matching PriceStamp.price precision
+PRICE_SCALE = 8
+
+KEY_FRAME = 1
+DELTA_FRAME = 0
+
+
+class DeltaEncoder:
+    """
+    Per-connection msgpack encoder for price ticks.
+
+    A tick becomes `[kind, sid, price, ts]`: `sid` is a small per-connection
+    symbol id (announced in the symbol's snapshot frame), `price` is in units
+    of 1e-8 and `ts` in epoch milliseconds. A key frame (`kind` = 1) carries
+    absolute values; after it, delta frames (`kind` = 0) carry the difference
+    to the previous tick of the same symbol. Everything else is packed as-is.
+    """
+
+    def __init__(self):
+        self.sids = {}
+        self.last = {}  # symbol → (price, ts) of the previous frame
+
+    def sid(self, symbol):
+        if symbol not in self.sids:
+            self.sids[symbol] = len(self.sids)
+        return self.sids[symbol]
+
+    def reset(self, symbol):
+        """Make the next tick of `symbol` a key frame, e.g. after a snapshot."""
+        self.last.pop(symbol, None)
+
+    def tick(self, data):
+        symbol = data.get("chart_type")
+        try:
+            price = int(Decimal(str(data["price"])).scaleb(PRICE_SCALE))
+            ts = int(data["ts"])
+        except (KeyError, TypeError, ValueError, InvalidOperation):
+            return data
+
+        previous = self.last.get(symbol)
+        self.last[symbol] = (price, ts)
+        if previous is None:
+            return [KEY_FRAME, self.sid(symbol), price, ts]
+        return [DELTA_FRAME, self.sid(symbol), price - previous[0], ts - previous[1]]
+
+    @staticmethod
+    def pack(payload):
+        return msgpack.packb(payload, use_bin_type=True)
+
+    @staticmethod
+    def unpack(data):
+        return msgpack.unpackb(data, raw=False)
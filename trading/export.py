@@ -0,0 +1,128 @@
+import csv
+import io
+import json
+from datetime import datetime, timezone as dt_timezone
+from itertools import chain
+
+from asgiref.sync import sync_to_async
+from rest_framework.renderers import JSONRenderer
+
+from .candles import base_interval
+from .models import Candle, PriceStamp
+
+# Rows fetched per round trip of the server-side cursor
+EXPORT_CHUNK_SIZE = 2000
+# Rows formatted into one chunk of the response body
+EXPORT_FLUSH_ROWS = 500
+
+TICK_COLUMNS = ('time', 'price')
+CANDLE_COLUMNS = ('time', 'open', 'high', 'low', 'close')
+
+
+class NDJSONRenderer(JSONRenderer):
+    """One JSON object per line; errors are rendered as a single JSON line."""
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+
+
+class CSVRenderer(JSONRenderer):
+    """Selects CSV exports; errors still come back as JSON."""
+    media_type = 'text/csv'
+    format = 'csv'
+
+
+def tick_rows(chart_type_id, end, start=None):
+    """(time, price) of every tick in [start, end), oldest first."""
+    ticks = PriceStamp.objects.filter(chart_type_id=chart_type_id, time__lt=end)
+    if start is not None:
+        ticks = ticks.filter(time__gte=start)
+    for time, price in ticks.order_by('time').values_list('time', 'price').iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        yield time.isoformat(), str(price)
+
+
+def candle_rows(chart_type_id, interval, end, start=None):
+    """
+    (time, open, high, low, close) of every `interval` candle with its bucket
+    in [start, end), oldest first.
+
+    Stored candles of the largest interval dividing `interval` are folded as
+    they are read, and each bucket is yielded once the next one starts, so
+    only one candle is held at a time.
+    """
+    candles = Candle.objects.filter(chart_type_id=chart_type_id, interval=base_interval(interval), time__lt=end)
+    if start is not None:
+        candles = candles.filter(time__gte=start)
+    rows = (
+        candles.order_by('time')
+        .values_list('time', 'open_price', 'close_price', 'min_price', 'max_price')
+        .iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    )
+
+    current = None
+    for time, open_price, close_price, min_price, max_price in rows:
+        epoch = int(time.timestamp())
+        bucket = epoch - epoch % interval
+        if current is None or current[0] != bucket:
+            if current is not None:
+                yield candle_row(current)
+            current = [bucket, open_price, max_price, min_price, close_price]
+        else:
+            current[2] = max(current[2], max_price)
+            current[3] = min(current[3], min_price)
+            current[4] = close_price
+    if current is not None:
+        yield candle_row(current)
+
+
+def candle_row(candle):
+    bucket, open_price, high, low, close = candle
+    return datetime.fromtimestamp(bucket, tz=dt_timezone.utc).isoformat(), open_price, high, low, close
+
+
+def ndjson_lines(columns, rows):
+    for row in rows:
+        yield json.dumps(dict(zip(columns, row))) + '\n'
+
+
+def csv_lines(columns, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in chain([columns], rows):
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def stream(lines, flush_rows=EXPORT_FLUSH_ROWS):
+    """Join formatted lines into response chunks of `flush_rows` lines each."""
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) >= flush_rows:
+            yield ''.join(chunk).encode()
+            chunk = []
+    if chunk:
+        yield ''.join(chunk).encode()
+
+
+def export_stream(fmt, columns, rows):
+    """Response body of `rows` as NDJSON or CSV (with a header line)."""
+    lines = csv_lines(columns, rows) if fmt == CSVRenderer.format else ndjson_lines(columns, rows)
+    return stream(lines)
+
+
+async def async_chunks(chunks):
+    """
+    Serve the sync `chunks` generator to an ASGI server one chunk at a time.
+
+    Django would otherwise consume a sync iterator whole before sending the
+    first byte. Every step runs on the request's sync thread, so the
+    server-side cursor stays on the connection that opened it.
+    """
+    step = sync_to_async(lambda: next(chunks, None), thread_sensitive=True)
+    try:
+        while (chunk := await step()) is not None:
+            yield chunk
+    finally:
+        await sync_to_async(chunks.close, thread_sensitive=True)()
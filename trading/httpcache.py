@@ -0,0 +1,106 @@
+import hashlib
+import logging
+import time
+
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.http import parse_etags
+
+from .models import Candle, ChartType
+
+logger = logging.getLogger(__name__)
+
+# Cached API responses; a version bump makes the old entries unreachable
+RESPONSE_TIMEOUT = 300
+
+CHART_TYPES_VERSION_KEY = "api:chart-types:version"
+
+
+def candles_version_key(chart_type_id):
+    return f"api:candles:version:{chart_type_id}"
+
+
+def new_version():
+    return str(time.time_ns())
+
+
+def get_version(key):
+    """Current version token of `key`, or None if the cache is unavailable."""
+    try:
+        version = cache.get(key)
+        if version is None:
+            version = new_version()
+            if not cache.add(key, version, timeout=None):
+                version = cache.get(key)
+        return version
+    except Exception as e:
+        logger.warning("Failed to read response cache version %s: %s", key, e)
+        return None
+
+
+def bump(keys):
+    try:
+        version = new_version()
+        cache.set_many({key: version for key in keys}, timeout=None)
+    except Exception as e:
+        logger.warning("Failed to bump response cache versions: %s", e)
+
+
+def candles_version(chart_type_id):
+    return get_version(candles_version_key(chart_type_id))
+
+
+def bump_candles_versions(chart_type_ids):
+    """Called whenever candles of these chart types were written."""
+    bump([candles_version_key(pk) for pk in set(chart_type_ids)])
+
+
+def chart_types_version():
+    return get_version(CHART_TYPES_VERSION_KEY)
+
+
+def response_key(*parts):
+    return "api:response:" + ":".join(str(part) for part in parts)
+
+
+def etag_for(key):
+    return '"%s"' % hashlib.md5(key.encode()).hexdigest()
+
+
+def not_modified(request, etag):
+    """Whether the client's If-None-Match already covers `etag`."""
+    header = request.headers.get("If-None-Match")
+    if not header:
+        return False
+    tags = parse_etags(header)
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+
+def cached_response(key, build):
+    """The data cached under `key`, building and storing it on a miss."""
+    try:
+        data = cache.get(key)
+    except Exception as e:
+        logger.warning("Failed to read cached response: %s", e)
+        return build()
+    if data is None:
+        data = build()
+        try:
+            cache.set(key, data, timeout=RESPONSE_TIMEOUT)
+        except Exception as e:
+            logger.warning("Failed to cache response: %s", e)
+    return data
+
+
+@receiver(post_save, sender=Candle)
+@receiver(post_delete, sender=Candle)
+def candle_changed(sender, instance, **kwargs):
+    # The listener writes with bulk_create and bumps through record_candles
+    bump_candles_versions([instance.chart_type_id])
+
+
+@receiver(post_save, sender=ChartType)
+@receiver(post_delete, sender=ChartType)
+def chart_type_changed(sender, **kwargs):
+    bump([CHART_TYPES_VERSION_KEY])
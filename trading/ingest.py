@@ -0,0 +1,264 @@
+import asyncio
+import json
+import socket
+import zlib
+from collections import deque
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from kombu import Consumer
+
+from .candles import restore_rollup, save_candles, save_checkpoint, CandleRollup
+from .models import PriceStamp
+from .metrics import now_ms, recorder
+from .registry import chart_types
+from .snapshots import seed_snapshots
+
+
+def stamp_received(data, message, received_at):
+    """Add the listener receipt time (`ts`) and latency stamps to a tick."""
+    data["ts"] = int(received_at.timestamp() * 1000)
+    lat = data["_lat"] = {"recv": received_at.timestamp() * 1000}
+
+    # AMQP timestamp property, if the publisher sets one
+    published = message.properties.get("timestamp") if message is not None else None
+    if isinstance(published, datetime):
+        published = published.timestamp()
+    if isinstance(published, (int, float)):
+        lat["pub"] = published * 1000
+        recorder.since(lat, "queue", "pub", data.get("chart_type"), ms=lat["recv"])
+
+
+def stamp_stage(ticks, stage, start, stamp, ms=None):
+    """Stamp ticks with `stamp` (now, or `ms`) and record `stage` as the time since `start`."""
+    ms = now_ms() if ms is None else ms
+    for data in ticks:
+        lat = data.get("_lat")
+        if lat is not None:
+            lat[stamp] = ms
+            recorder.since(lat, stage, start, data.get("chart_type"), ms=ms)
+
+
+def stamp_written(ticks):
+    stamp_stage(ticks, "write", "recv", "written")
+
+
+def drop_deleted_charts(rollup):
+    """
+    Reload the registry and forget the rollup state of chart types deleted
+    (or recreated under a new id) by another process since it was loaded.
+    Their ticks are then skipped as unknown symbols instead of failing every
+    batch on the foreign key.
+    """
+    chart_types.invalidate()
+    live = {chart.symbol: chart.id for chart in chart_types.all()}
+    stale = {symbol for symbol in rollup.last_tick if symbol not in live}
+    stale |= {symbol for (symbol, _), (chart, _) in rollup.open.items() if live.get(symbol) != chart.id}
+    if stale:
+        rollup.forget(stale)
+        print(f"[RabbitMQ] Удалены графики: {', '.join(sorted(stale))}")
+
+
+def write_ticks(rollup, ticks, now):
+    """
+    Store a batch of `(data, received_at)` ticks and fold them into `rollup`.
+
+    PriceStamps, closed candles and the rollup checkpoint are written in one
+    transaction. If it fails the rollup is restored and the error re-raised,
+    so the caller can requeue the messages; on an IntegrityError chart types
+    deleted meanwhile are dropped first (see `drop_deleted_charts`). Returns (stamps, candles) counts.
+    """
+    snapshot = rollup.snapshot()
+    parsed = []
+    candles = []
+    try:
+        with transaction.atomic():
+            for data, received_at in ticks:
+                if data is None or data.get("type") != "message":
+                    continue
+                try:
+                    chart = chart_types.get(data["chart_type"])
+                    price = Decimal(data["price"])
+                except Exception as e:
+                    print(f"[ERROR] Ошибка при обработке: {e}")
+                    continue
+                parsed.append((data, chart, price, received_at))
+
+            PriceStamp.objects.bulk_create([
+                PriceStamp(chart_type=chart, price=price, time=received_at)
+                for _, chart, price, received_at in parsed
+            ])
+            inserted = now_ms()
+
+            for _, chart, price, received_at in parsed:
+                candles.extend(rollup.add(chart, price, received_at))
+            candles.extend(rollup.close_expired(now))
+            save_candles(candles)
+            # Открытые свечи фиксируются вместе с тиками этой пачки
+            save_checkpoint(rollup)
+            built = now_ms()
+    except Exception as e:
+        rollup.restore(snapshot)
+        if isinstance(e, IntegrityError):
+            # Скорее всего график удалён в другом процессе — повтор пачки его пропустит
+            drop_deleted_charts(rollup)
+        raise
+
+    # Стадии пишем только после коммита, чтобы повторная доставка не считалась дважды
+    datas = [data for data, _, _, _ in parsed]
+    for data in datas:
+        data["_stored"] = True
+    stamp_stage(datas, "insert", "recv", "inserted", ms=inserted)
+    stamp_stage(datas, "candles", "inserted", "built", ms=built)
+    return len(parsed), len(candles)
+
+
+def shard_for(symbol, shards):
+    return zlib.crc32(symbol.encode()) % shards
+
+
+class AsyncListener:
+    """
+    asyncio mode of the rabbit listener.
+
+    Messages are routed by symbol to `shards` worker tasks, so every symbol is
+    processed in order while different symbols run concurrently. Each shard owns
+    its own CandleRollup and writes whatever is queued for it (up to
+    `batch_size` ticks) in one `write_ticks` call on a bounded DB thread pool,
+    then awaits the channel layer directly. kombu is not thread-safe, so the
+    connection, acks and requeues all stay on a single AMQP thread. Broadcast
+    errors are logged per batch (the ticks are stored and acked regardless);
+    any task that still dies stops the listener instead of leaving its shard
+    unread.
+    """
+
+    def __init__(self, conn, queue, broadcaster, shards=4, db_workers=4, batch_size=100):
+        self.conn = conn
+        self.queue = queue
+        self.broadcaster = broadcaster
+        self.shards = shards
+        self.batch_size = batch_size
+        self.rollups = [CandleRollup() for _ in range(shards)]
+        self.db_pool = ThreadPoolExecutor(max_workers=db_workers, thread_name_prefix="ingest-db")
+        self.amqp_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingest-amqp")
+        self.settled = deque()  # (message, ok) — ack/requeue on the AMQP thread
+        self.queues = []
+
+    def run(self):
+        asyncio.run(self.main())
+
+    async def main(self):
+        loop = asyncio.get_running_loop()
+        self.queues = [asyncio.Queue() for _ in range(self.shards)]
+
+        # Восстанавливаем незакрытые свечи каждого шарда
+        now = timezone.now()
+        charts = await loop.run_in_executor(self.db_pool, chart_types.all)
+        for index, rollup in enumerate(self.rollups):
+            own = [c for c in charts if shard_for(c.symbol, self.shards) == index]
+            closed = await loop.run_in_executor(self.db_pool, restore_rollup, rollup, now, own)
+            await loop.run_in_executor(self.db_pool, save_candles, closed)
+        await loop.run_in_executor(self.db_pool, seed_snapshots)
+
+        workers = [asyncio.create_task(self.worker(index)) for index in range(self.shards)]
+        workers.append(asyncio.create_task(self.timer()))
+        workers.append(asyncio.create_task(self.metrics()))
+        if self.broadcaster.rate:
+            workers.append(asyncio.create_task(self.flusher()))
+
+        def on_message(body, message):
+            loop.call_soon_threadsafe(self.dispatch, body, message)
+
+        consumer = Consumer(self.conn, queues=self.queue, callbacks=[on_message], accept=["json"])
+        await loop.run_in_executor(self.amqp_pool, consumer.consume)
+        await loop.run_in_executor(
+            self.amqp_pool, lambda: consumer.qos(prefetch_count=self.shards * self.batch_size * 2)
+        )
+        print(f"[RabbitMQ] Слушатель запущен (asyncio, шардов: {self.shards})")
+        try:
+            while True:
+                await loop.run_in_executor(self.amqp_pool, self.drain)
+                # Упавший шард больше не читает свою очередь — останавливаем процесс
+                for task in workers:
+                    if task.done():
+                        raise RuntimeError("Listener task stopped") from task.exception()
+        finally:
+            for task in workers:
+                task.cancel()
+
+    def drain(self):
+        while self.settled:
+            message, ok = self.settled.popleft()
+            if ok:
+                message.ack()
+            else:
+                message.requeue()
+        try:
+            self.conn.drain_events(timeout=0.05)
+        except socket.timeout:
+            pass
+
+    def dispatch(self, body, message):
+        # Время приёма ставим в потоке event loop, чтобы в очереди шарда оно не убывало
+        data = json.loads(body)
+        symbol = data.get("chart_type") or ""
+        index = shard_for(symbol, self.shards)
+        received_at = timezone.now()
+        stamp_received(data, message, received_at)
+        self.queues[index].put_nowait((data, received_at, message))
+
+    async def timer(self):
+        # Раз в секунду шарды закрывают свечи, даже если тиков нет
+        while True:
+            await asyncio.sleep(1)
+            now = timezone.now()
+            for queue in self.queues:
+                queue.put_nowait((None, now, None))
+
+    async def metrics(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(1)
+            await loop.run_in_executor(self.db_pool, recorder.publish_if_due)
+
+    async def flusher(self):
+        while True:
+            await asyncio.sleep(self.broadcaster.time_left())
+            if self.broadcaster.time_left() == 0:
+                try:
+                    await self.broadcaster.aflush()
+                except Exception as e:
+                    print(f"[ERROR] Не удалось разослать цены: {e}")
+
+    async def worker(self, index):
+        loop = asyncio.get_running_loop()
+        queue = self.queues[index]
+        rollup = self.rollups[index]
+
+        while True:
+            items = [await queue.get()]
+            while len(items) < self.batch_size and not queue.empty():
+                items.append(queue.get_nowait())
+
+            ticks = [(data, received_at) for data, received_at, _ in items]
+            try:
+                await loop.run_in_executor(
+                    self.db_pool, write_ticks, rollup, ticks, items[-1][1]
+                )
+            except Exception as e:
+                print(f"[ERROR] Шард {index}: не удалось записать {len(items)} тиков: {e}")
+                self.settled.extend((message, False) for _, _, message in items if message)
+                continue
+
+            stamp_written(data for data, _, message in items if message)
+            try:
+                for data, _, message in items:
+                    if message is not None:
+                        await self.broadcaster.apublish(data)
+            except Exception as e:
+                # Тики уже в базе: подтверждаем их, клиенты получат следующие
+                print(f"[ERROR] Шард {index}: не удалось разослать тики: {e}")
+            self.settled.extend((message, True) for _, _, message in items if message)
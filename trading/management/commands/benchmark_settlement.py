@@ -0,0 +1,174 @@
+import gc
+import json
+import random
+import time
+import tracemalloc
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import F
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from trading.models import Bet, ChartType, PriceStamp, UserProfile
+from trading.settlement import settle_expired
+
+
+CONFIG_KEYS = ('users', 'chart_types', 'bets', 'ticks', 'window', 'batch_size', 'partitions', 'seed', 'trace_memory')
+
+
+def rss_mb(field):
+    """VmRSS/VmHWM of this process from /proc, or None off Linux."""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def reset_peak_rss():
+    """Reset VmHWM to the current RSS (Linux only); False if that is not possible."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+class Command(BaseCommand):
+    help = 'Seeds expired bets, runs settlement and prints bets/sec, queries per bet and peak memory as JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--chart-types', type=int, default=10)
+        parser.add_argument('--bets', type=int, default=20000)
+        parser.add_argument('--ticks', type=int, default=1000, help='PriceStamps per chart type')
+        parser.add_argument('--window', type=int, default=3600, help='Seconds the ticks and expiries are spread over')
+        parser.add_argument('--batch-size', type=int, default=settings.SETTLEMENT_BATCH_SIZE)
+        parser.add_argument(
+            '--partitions', type=int, default=1,
+            help='Settle user_id %% partitions one after another, as settle_partition tasks would',
+        )
+        parser.add_argument('--seed', type=int, default=0, help='Random seed')
+        parser.add_argument('--keep', action='store_true', help='Keep the seeded and settled data instead of deleting it')
+        parser.add_argument(
+            '--trace-memory', action='store_true',
+            help='Report the peak Python allocation of settlement with tracemalloc (slows settlement down)',
+        )
+        parser.add_argument('--output', help='Also write the JSON report to this file')
+
+    def handle(self, *args, **options):
+        random.seed(options['seed'])
+        tag = uuid.uuid4().hex[:4]
+        # Seed and settle in committed transactions, as production does, so
+        # the commit cost is measured; the seeded rows are deleted afterwards
+        try:
+            seed_seconds = self.seed(tag, options)
+            gc.collect()
+            report = self.settle(options)
+            report['seed_seconds'] = round(seed_seconds, 3)
+        finally:
+            if not options['keep']:
+                self.cleanup(tag)
+
+        report = {
+            'database': connection.vendor,
+            'config': {key: options[key] for key in CONFIG_KEYS},
+            **report,
+        }
+        output = json.dumps(report, indent=2)
+        self.stdout.write(output)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+
+    def seed(self, tag, options):
+        started = time.perf_counter()
+        now = timezone.now()
+        window = options['window']
+
+        charts = ChartType.objects.bulk_create([
+            ChartType(name=f'bench-{tag}-{i}', symbol=f'B{i}-{tag}') for i in range(options['chart_types'])
+        ])
+        # bulk_create skips the post_save signal that creates profiles
+        users = User.objects.bulk_create([
+            User(username=f'bench-{tag}-{i}') for i in range(options['users'])
+        ])
+        UserProfile.objects.bulk_create([UserProfile(user=user) for user in users])
+
+        stamps = []
+        for chart in charts:
+            for _ in range(options['ticks']):
+                stamps.append(PriceStamp(
+                    chart_type=chart,
+                    price=Decimal(random.randint(90000, 110000)) / 100,
+                    time=now - timedelta(seconds=random.uniform(0, window)),
+                ))
+        PriceStamp.objects.bulk_create(stamps, batch_size=5000)
+
+        bets = []
+        for _ in range(options['bets']):
+            bets.append(Bet(
+                user=random.choice(users),
+                chart_type=random.choice(charts),
+                amount=Decimal(random.randint(1, 100)),
+                direction=random.choice(['UP', 'DOWN']),
+                entry_price=Decimal(1000),
+                expires_at=now - timedelta(seconds=random.uniform(0, window)),
+            ))
+        Bet.objects.bulk_create(bets, batch_size=5000)
+        # Settlement skips bets that expired before they were placed
+        Bet.objects.filter(chart_type__in=charts).update(created_at=F('expires_at') - timedelta(minutes=1))
+        return time.perf_counter() - started
+
+    def settle(self, options):
+        partitions = options['partitions']
+        now = timezone.now()
+        trace = options['trace_memory']
+
+        rss_before = rss_mb('VmRSS')
+        peak_reset = reset_peak_rss()
+        if trace:
+            tracemalloc.start()
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            settled = skipped = 0
+            for index in range(partitions):
+                partition = (index, partitions) if partitions > 1 else None
+                done, left = settle_expired(now, batch_size=options['batch_size'], partition=partition)
+                settled += done
+                skipped += left
+            elapsed = time.perf_counter() - started
+        peak = None
+        if trace:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        rss_peak = rss_mb('VmHWM') if peak_reset else None
+
+        return {
+            'bets_settled': settled,
+            'bets_skipped': skipped,
+            'settle_seconds': round(elapsed, 3),
+            'bets_per_sec': round(settled / elapsed, 1) if elapsed else None,
+            'queries': len(queries.captured_queries),
+            'queries_per_bet': round(len(queries.captured_queries) / settled, 4) if settled else None,
+            'peak_memory_mb': round(peak / 2 ** 20, 2) if peak is not None else None,
+            # Growth of the resident set over what it was when settlement began
+            'peak_rss_delta_mb': (
+                round(rss_peak - rss_before, 1) if rss_peak is not None and rss_before is not None else None
+            ),
+        }
+
+    def cleanup(self, tag):
+        # Bets, completed bets, profiles, stats and ticks go with their users and chart types
+        User.objects.filter(username__startswith=f'bench-{tag}-').delete()
+        ChartType.objects.filter(name__startswith=f'bench-{tag}-').delete()
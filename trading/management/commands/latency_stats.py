@@ -0,0 +1,38 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from trading.metrics import collect
+
+
+class Command(BaseCommand):
+    help = 'Shows tick latency histograms (per stage and symbol) of the listener and ASGI processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--json', action='store_true', help='Print raw JSON instead of a table')
+        parser.add_argument('--symbols', action='store_true', help='Also show every symbol separately')
+
+    def handle(self, *args, **options):
+        stats = collect()
+
+        if options['json']:
+            self.stdout.write(json.dumps(stats, indent=2))
+            return
+
+        if not stats:
+            self.stdout.write(self.style.WARNING('No latency data published yet'))
+            return
+
+        header = f"{'stage':<10} {'symbol':<12} {'count':>9} {'mean':>9} {'p50':>7} {'p90':>7} {'p99':>7} {'max':>9}"
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+        for stage, data in stats.items():
+            rows = [('*', data['all'])]
+            if options['symbols']:
+                rows += list(data['symbols'].items())
+            for symbol, s in rows:
+                self.stdout.write(
+                    f"{stage:<10} {symbol:<12} {s['count']:>9} {s['mean_ms']:>9} "
+                    f"{s['p50_ms']:>7} {s['p90_ms']:>7} {s['p99_ms']:>7} {s['max_ms']:>9}"
+                )
+        self.stdout.write('(ms; percentiles are histogram bucket upper bounds)')
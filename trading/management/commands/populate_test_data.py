@@ -1,6 +1,7 @@
 from django.core.management.base import BaseCommand
 from django.contrib.auth.models import User
 from trading.models import Candle, Bet, ChartType, UserProfile, ManualControl
+from trading.candles import bucket_start
 from decimal import Decimal
 from django.utils import timezone
 import random
@@ -25,16 +26,18 @@ class Command(BaseCommand):
             chart_type, _ = ChartType.objects.get_or_create(name=name, symbol=symbol)
             chart_types.append(chart_type)
 
-        # Create test candles for each chart type
+        # Create test hourly candles for each chart type
+        current_hour = bucket_start(timezone.now(), 3600)
         for chart_type in chart_types:
             for i in range(50):
-                time = timezone.now() - timezone.timedelta(hours=i)
+                time = current_hour - timezone.timedelta(hours=i)
                 open_price = random.uniform(30000, 40000)
                 close_price = random.uniform(30000, 40000)
                 min_price = min(open_price, close_price) - random.uniform(0, 1000)
                 max_price = max(open_price, close_price) + random.uniform(0, 1000)
                 Candle.objects.create(
                     chart_type=chart_type,
+                    interval=3600,
                     time=time,
                     open_price=open_price,
                     close_price=close_price,
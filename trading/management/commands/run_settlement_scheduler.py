@@ -0,0 +1,37 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from channels.layers import get_channel_layer
+
+from trading.scheduler import SettlementScheduler
+
+
+class Command(BaseCommand):
+    help = 'Settles bets as soon as they expire (replaces polling by the process_bets beat task)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--delay',
+            type=float,
+            default=settings.SETTLEMENT_DELAY,
+            help='Seconds to wait after expiry so the ticks up to it have been written',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=settings.SETTLEMENT_BATCH_SIZE,
+            help='Bets settled per transaction',
+        )
+        parser.add_argument(
+            '--resync',
+            type=float,
+            default=settings.SETTLEMENT_RESYNC,
+            help='Seconds between sweeps of the bet table for bets the scheduler missed',
+        )
+
+    def handle(self, *args, **options):
+        SettlementScheduler(
+            get_channel_layer(),
+            delay=options['delay'],
+            batch_size=options['batch_size'],
+            resync=options['resync'],
+        ).run()
@@ -6,7 +6,7 @@ import sys
 import time
 
 class Command(BaseCommand):
-    help = 'Starts Django server, Celery worker, and Celery beat'
+    help = 'Starts Django server, Celery worker, Celery beat and the settlement scheduler'
 
     def handle(self, *args, **options):
         processes = []
@@ -32,6 +32,13 @@ class Command(BaseCommand):
             ])
             processes.append(beat)
             self.stdout.write('Started Celery beat')
+
+            # Start settlement scheduler
+            settlement = subprocess.Popen([
+                'python', 'manage.py', 'run_settlement_scheduler'
+            ])
+            processes.append(settlement)
+            self.stdout.write('Started settlement scheduler')
             
             # Keep the command running
             while True:
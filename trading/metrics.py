@@ -0,0 +1,182 @@
+import bisect
+import logging
+import os
+import socket
+import threading
+import time
+
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the histogram buckets, in milliseconds (the last one is +inf)
+BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+SOURCES_KEY = "metrics:latency:sources"
+PUBLISH_INTERVAL = 5  # seconds between pushes of this process' histograms
+SOURCE_TTL = 60  # a process that stopped pushing disappears after this long
+
+# Tick stages, in pipeline order. Ticks carry their stamps ("pub", "recv",
+# "inserted", "built", "written", epoch ms) in a private `_lat` dict that the
+# broadcaster moves from the tick into the channel layer event.
+#   queue     RabbitMQ publish (AMQP timestamp) → listener receive
+#   insert    receive → PriceStamp inserted
+#   candles   PriceStamp inserted → candles built and saved (with checkpoint)
+#   write     receive → PriceStamp/candles committed
+#   publish   commit → channel layer group_send returned
+#   deliver   commit → frame sent by PriceConsumer
+#   total     receive → frame sent by PriceConsumer
+STAGES = ("queue", "insert", "candles", "write", "publish", "deliver", "total")
+
+
+def now_ms():
+    return time.time() * 1000
+
+
+class LatencyHistogram:
+    __slots__ = ("counts", "count", "total", "max")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, ms):
+        ms = max(ms, 0.0)
+        self.counts[bisect.bisect_left(BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.total += ms
+        if ms > self.max:
+            self.max = ms
+
+    def merge(self, data):
+        for i, n in enumerate(data["counts"]):
+            self.counts[i] += n
+        self.count += data["count"]
+        self.total += data["total"]
+        self.max = max(self.max, data["max"])
+
+    def percentile(self, q):
+        """Upper bound of the bucket holding the q-th percentile."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return BUCKETS_MS[i] if i < len(BUCKETS_MS) else self.max
+        return self.max
+
+    def to_dict(self):
+        return {"counts": list(self.counts), "count": self.count, "total": self.total, "max": self.max}
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total / self.count, 3) if self.count else None,
+            "p50_ms": self.percentile(0.5),
+            "p90_ms": self.percentile(0.9),
+            "p99_ms": self.percentile(0.99),
+            "max_ms": round(self.max, 3),
+        }
+
+
+class LatencyRecorder:
+    """
+    Per-process latency histograms keyed by (stage, symbol).
+
+    The listener and every ASGI process record their own stages and push them
+    to the cache every PUBLISH_INTERVAL seconds, so the `latency_stats`
+    command and the metrics endpoint can merge all processes.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.source = f"{socket.gethostname()}:{os.getpid()}"
+        self.last_publish = 0.0
+
+    def observe(self, stage, symbol, ms):
+        with self.lock:
+            key = (stage, symbol or "")
+            if key not in self.histograms:
+                self.histograms[key] = LatencyHistogram()
+            self.histograms[key].observe(ms)
+
+    def since(self, lat, stage, start, symbol, ms=None):
+        """Record `stage` as the time elapsed since the `start` stamp in `lat`."""
+        if lat and start in lat:
+            self.observe(stage, symbol, (now_ms() if ms is None else ms) - lat[start])
+
+    def export(self):
+        with self.lock:
+            return {f"{stage}|{symbol}": h.to_dict() for (stage, symbol), h in self.histograms.items()}
+
+    def publish_if_due(self):
+        if time.monotonic() - self.last_publish < PUBLISH_INTERVAL:
+            return
+        self.last_publish = time.monotonic()
+        try:
+            sources = cache.get(SOURCES_KEY) or {}
+            sources = prune(sources)
+            sources[self.source] = time.time()
+            cache.set_many({SOURCES_KEY: sources, source_key(self.source): self.export()}, timeout=None)
+        except Exception as e:
+            logger.warning("Failed to publish latency metrics: %s", e)
+
+    async def apublish_if_due(self):
+        if time.monotonic() - self.last_publish < PUBLISH_INTERVAL:
+            return
+        self.last_publish = time.monotonic()
+        try:
+            sources = await cache.aget(SOURCES_KEY) or {}
+            sources = prune(sources)
+            sources[self.source] = time.time()
+            await cache.aset_many({SOURCES_KEY: sources, source_key(self.source): self.export()}, timeout=None)
+        except Exception as e:
+            logger.warning("Failed to publish latency metrics: %s", e)
+
+
+def source_key(source):
+    return f"metrics:latency:{source}"
+
+
+def prune(sources):
+    return {s: seen for s, seen in sources.items() if time.time() - seen < SOURCE_TTL}
+
+
+def collect():
+    """
+    Merge the histograms pushed by every live process.
+
+    Returns `{stage: {"all": summary, "symbols": {symbol: summary}}}`.
+    """
+    live = prune(cache.get(SOURCES_KEY) or {})
+    exported = cache.get_many([source_key(s) for s in live]).values()
+
+    merged = {}
+    for data in exported:
+        for key, hist in data.items():
+            stage, symbol = key.split("|", 1)
+            for name in (symbol, None):
+                if (stage, name) not in merged:
+                    merged[(stage, name)] = LatencyHistogram()
+                merged[(stage, name)].merge(hist)
+
+    result = {}
+    for stage in STAGES:
+        if (stage, None) not in merged:
+            continue
+        result[stage] = {
+            "all": merged[(stage, None)].summary(),
+            "symbols": {
+                symbol: h.summary() for (s, symbol), h in sorted(merged.items(), key=lambda i: str(i[0]))
+                if s == stage and symbol is not None
+            },
+        }
+    return result
+
+
+recorder = LatencyRecorder()
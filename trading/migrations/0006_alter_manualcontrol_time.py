@@ -0,0 +1,20 @@
+# Generated by Django 5.1.1 on 2025-04-09 16:42
+
+import datetime
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trading', '0005_alter_bet_timeframe_alter_manualcontrol_time_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='manualcontrol',
+            name='time',
+            field=models.DateTimeField(validators=[django.core.validators.MinValueValidator(limit_value=datetime.datetime(2025, 4, 8, 16, 42, 24, 810357, tzinfo=datetime.timezone.utc)), django.core.validators.MaxValueValidator(limit_value=datetime.datetime(2025, 4, 9, 16, 43, 24, 810371, tzinfo=datetime.timezone.utc))]),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.1.1 on 2025-04-15 01:09
+
+import datetime
+import django.core.validators
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trading', '0006_alter_manualcontrol_time'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='manualcontrol',
+            name='time',
+            field=models.DateTimeField(validators=[django.core.validators.MinValueValidator(limit_value=datetime.datetime(2025, 4, 14, 1, 9, 48, 217764, tzinfo=datetime.timezone.utc)), django.core.validators.MaxValueValidator(limit_value=datetime.datetime(2025, 4, 15, 1, 10, 48, 217779, tzinfo=datetime.timezone.utc))]),
+        ),
+        migrations.CreateModel(
+            name='CompletedBet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('direction', models.CharField(choices=[('UP', 'Up'), ('DOWN', 'Down')], max_length=4)),
+                ('entry_price', models.DecimalField(decimal_places=8, max_digits=20)),
+                ('closing_price', models.DecimalField(decimal_places=8, max_digits=20)),
+                ('result', models.CharField(choices=[('WIN', 'Win'), ('LOSS', 'Loss')], max_length=4)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('chart_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='trading.charttype')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
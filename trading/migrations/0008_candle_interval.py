@@ -0,0 +1,83 @@
+# Generated by Django 5.1.1 on 2026-10-18 06:56
+
+import datetime
+import django.core.validators
+from django.db import migrations, models
+from django.utils import timezone
+
+INTERVALS = (5, 60, 300, 3600, 86400)
+
+
+def rebuild_candles(apps, schema_editor):
+    """
+    Replace the old 5-tick candles with wall-clock aligned ones.
+
+    The old rows are stamped with their last tick rather than a bucket start,
+    so they would mix into the aligned 5s series; every interval is rebuilt
+    from the PriceStamps instead. Buckets still open now are left to the
+    listener, which derives them from the same ticks on start.
+    """
+    Candle = apps.get_model('trading', 'Candle')
+    ChartType = apps.get_model('trading', 'ChartType')
+    PriceStamp = apps.get_model('trading', 'PriceStamp')
+
+    Candle.objects.all().delete()
+    now = timezone.now().timestamp()
+    rows = []
+
+    def close(chart_id, interval, bucket):
+        start, open_price, high, low, close_price = bucket
+        if start + interval <= now:
+            rows.append(Candle(
+                chart_type_id=chart_id, interval=interval,
+                time=datetime.datetime.fromtimestamp(start, tz=datetime.timezone.utc),
+                open_price=open_price, close_price=close_price, min_price=low, max_price=high,
+            ))
+        if len(rows) >= 5000:
+            Candle.objects.bulk_create(rows)
+            rows.clear()
+
+    for chart_id in ChartType.objects.values_list('id', flat=True):
+        current = {}
+        ticks = PriceStamp.objects.filter(chart_type_id=chart_id).order_by('time').values_list('time', 'price')
+        for time, price in ticks.iterator(chunk_size=2000):
+            epoch, price = int(time.timestamp()), float(price)
+            for interval in INTERVALS:
+                start = epoch - epoch % interval
+                bucket = current.get(interval)
+                if bucket is not None and bucket[0] == start:
+                    bucket[2] = max(bucket[2], price)
+                    bucket[3] = min(bucket[3], price)
+                    bucket[4] = price
+                    continue
+                if bucket is not None:
+                    close(chart_id, interval, bucket)
+                current[interval] = [start, price, price, price, price]
+        for interval, bucket in current.items():
+            close(chart_id, interval, bucket)
+    Candle.objects.bulk_create(rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trading', '0007_alter_manualcontrol_time_completedbet'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='candle',
+            name='interval',
+            field=models.PositiveIntegerField(choices=[(5, '5s'), (60, '1m'), (300, '5m'), (3600, '1h'), (86400, '1d')], default=5),
+        ),
+        migrations.RunPython(rebuild_candles, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='manualcontrol',
+            name='time',
+            field=models.DateTimeField(validators=[django.core.validators.MinValueValidator(limit_value=datetime.datetime(2026, 10, 17, 6, 56, 10, 753930, tzinfo=datetime.timezone.utc)), django.core.validators.MaxValueValidator(limit_value=datetime.datetime(2026, 10, 18, 6, 57, 10, 753962, tzinfo=datetime.timezone.utc))]),
+        ),
+        migrations.AddConstraint(
+            model_name='candle',
+            constraint=models.UniqueConstraint(fields=('chart_type', 'interval', 'time'), name='unique_candle_bucket'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.1.1 on 2026-10-18 06:57
+
+import datetime
+import django.core.validators
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trading', '0008_candle_interval'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CandleCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('interval', models.PositiveIntegerField(choices=[(5, '5s'), (60, '1m'), (300, '5m'), (3600, '1h'), (86400, '1d')])),
+                ('time', models.DateTimeField()),
+                ('open_price', models.FloatField()),
+                ('close_price', models.FloatField()),
+                ('min_price', models.FloatField()),
+                ('max_price', models.FloatField()),
+                ('last_tick', models.DateTimeField()),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='manualcontrol',
+            name='time',
+            field=models.DateTimeField(validators=[django.core.validators.MinValueValidator(limit_value=datetime.datetime(2026, 10, 17, 6, 57, 33, 463531, tzinfo=datetime.timezone.utc)), django.core.validators.MaxValueValidator(limit_value=datetime.datetime(2026, 10, 18, 6, 58, 33, 463554, tzinfo=datetime.timezone.utc))]),
+        ),
+        migrations.AddIndex(
+            model_name='pricestamp',
+            index=models.Index(fields=['chart_type', 'time'], name='pricestamp_chart_time_idx'),
+        ),
+        migrations.AddField(
+            model_name='candlecheckpoint',
+            name='chart_type',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='trading.charttype'),
+        ),
+        migrations.AddConstraint(
+            model_name='candlecheckpoint',
+            constraint=models.UniqueConstraint(fields=('chart_type', 'interval'), name='unique_candle_checkpoint'),
+        ),
+    ]
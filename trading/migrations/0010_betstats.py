@@ -0,0 +1,60 @@
+# Generated by Django 5.1.1 on 2026-10-18 07:13
+
+import datetime
+import django.core.validators
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def backfill_stats(apps, schema_editor):
+    BetStats = apps.get_model('trading', 'BetStats')
+    CompletedBet = apps.get_model('trading', 'CompletedBet')
+
+    completed = CompletedBet.objects.values('user_id').annotate(
+        wins=Count('id', filter=Q(result='WIN')),
+        losses=Count('id', filter=Q(result='LOSS')),
+        total_profit=Sum('amount', filter=Q(result='WIN')),
+        total_loss=Sum('amount', filter=Q(result='LOSS')),
+    )
+    BetStats.objects.bulk_create(
+        (
+            BetStats(
+                user_id=row['user_id'],
+                wins=row['wins'],
+                losses=row['losses'],
+                total_profit=row['total_profit'] or 0,
+                total_loss=row['total_loss'] or 0,
+            )
+            for row in completed
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('trading', '0009_candlecheckpoint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BetStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('wins', models.PositiveIntegerField(default=0)),
+                ('losses', models.PositiveIntegerField(default=0)),
+                ('total_profit', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('total_loss', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+        ),
+        migrations.RunPython(backfill_stats, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='manualcontrol',
+            name='time',
+            field=models.DateTimeField(validators=[django.core.validators.MinValueValidator(limit_value=datetime.datetime(2026, 10, 17, 7, 13, 5, 749281, tzinfo=datetime.timezone.utc)), django.core.validators.MaxValueValidator(limit_value=datetime.datetime(2026, 10, 18, 7, 14, 5, 749315, tzinfo=datetime.timezone.utc))]),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.1.1 on 2026-10-18 07:14
+
+import datetime
+import django.core.validators
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trading', '0010_betstats'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='manualcontrol',
+            name='time',
+            field=models.DateTimeField(validators=[django.core.validators.MinValueValidator(limit_value=datetime.datetime(2026, 10, 17, 7, 14, 51, 845956, tzinfo=datetime.timezone.utc)), django.core.validators.MaxValueValidator(limit_value=datetime.datetime(2026, 10, 18, 7, 15, 51, 845978, tzinfo=datetime.timezone.utc))]),
+        ),
+        migrations.AddIndex(
+            model_name='bet',
+            index=models.Index(fields=['user', 'created_at', 'id'], name='bet_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='completedbet',
+            index=models.Index(fields=['user', 'created_at', 'id'], name='completedbet_user_created_idx'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.1.1 on 2026-10-18 07:18
+
+import datetime
+import django.core.validators
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trading', '0011_bet_history_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='manualcontrol',
+            name='time',
+            field=models.DateTimeField(validators=[django.core.validators.MinValueValidator(limit_value=datetime.datetime(2026, 10, 17, 7, 18, 32, 28588, tzinfo=datetime.timezone.utc)), django.core.validators.MaxValueValidator(limit_value=datetime.datetime(2026, 10, 18, 7, 19, 32, 28611, tzinfo=datetime.timezone.utc))]),
+        ),
+        migrations.AddIndex(
+            model_name='bet',
+            index=models.Index(fields=['result', 'expires_at', 'id'], name='bet_result_expires_idx'),
+        ),
+    ]
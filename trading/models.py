@@ -14,15 +14,44 @@ class ChartType(models.Model):
         return self.name
 
 class Candle(models.Model):
+    # Resolutions persisted by the rollup engine, in seconds
+    INTERVAL_CHOICES = [(5, '5s'), (60, '1m'), (300, '5m'), (3600, '1h'), (86400, '1d')]
+
+    chart_type = models.ForeignKey(ChartType, on_delete=models.CASCADE)
+    interval = models.PositiveIntegerField(choices=INTERVAL_CHOICES, default=5)
+    time = models.DateTimeField()  # start of the bucket
+    open_price = models.FloatField()
+    close_price = models.FloatField()
+    min_price = models.FloatField()
+    max_price = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['chart_type', 'interval', 'time'], name='unique_candle_bucket'),
+        ]
+
+    def __str__(self):
+        return f"{self.chart_type.symbol} {self.get_interval_display()} Candle at {self.time}"
+
+
+class CandleCheckpoint(models.Model):
+    """Still-open candle of the rabbit listener, saved so a restart can resume it."""
     chart_type = models.ForeignKey(ChartType, on_delete=models.CASCADE)
-    time = models.DateTimeField()
+    interval = models.PositiveIntegerField(choices=Candle.INTERVAL_CHOICES)
+    time = models.DateTimeField()  # start of the bucket
     open_price = models.FloatField()
     close_price = models.FloatField()
     min_price = models.FloatField()
     max_price = models.FloatField()
+    last_tick = models.DateTimeField()  # newest PriceStamp folded into the bucket
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['chart_type', 'interval'], name='unique_candle_checkpoint'),
+        ]
 
     def __str__(self):
-        return f"{self.chart_type.symbol} Candle at {self.time}"
+        return f"{self.chart_type.symbol} {self.get_interval_display()} checkpoint at {self.last_tick}"
 
 
 class PriceStamp(models.Model):
@@ -30,6 +59,11 @@ class PriceStamp(models.Model):
     price = models.DecimalField(max_digits=20, decimal_places=8)
     time = models.DateTimeField(default=timezone.now)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['chart_type', 'time'], name='pricestamp_chart_time_idx'),
+        ]
+
     def __str__(self):
         return f"{self.chart_type.symbol} - {self.price}"
 
@@ -74,6 +108,14 @@ class Bet(models.Model):
         default='PENDING'
     )
 
+    class Meta:
+        indexes = [
+            # Keyset pagination of a user's bets
+            models.Index(fields=['user', 'created_at', 'id'], name='bet_user_created_idx'),
+            # Settlement: pending bets in expiry order
+            models.Index(fields=['result', 'expires_at', 'id'], name='bet_result_expires_idx'),
+        ]
+
     def __str__(self):
         return f"{self.user.username}'s {self.direction} bet of ${self.amount} on {self.chart_type.symbol}"
 
@@ -96,10 +138,33 @@ class CompletedBet(models.Model):
     result = models.CharField(max_length=4, choices=RESULT_CHOICES)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Keyset pagination of a user's history
+            models.Index(fields=['user', 'created_at', 'id'], name='completedbet_user_created_idx'),
+        ]
+
     def __str__(self):
         return f"{self.user.username}'s {self.result} bet on {self.chart_type.symbol}"
 
 
+class BetStats(models.Model):
+    """
+    Running per-user totals of settled bets, updated by settlement so the
+    statistics endpoint doesn't aggregate the CompletedBet history. Pending
+    bets are counted live: settled bets leave the Bet table, so it only ever
+    holds the user's open ones.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True)
+    wins = models.PositiveIntegerField(default=0)
+    losses = models.PositiveIntegerField(default=0)
+    total_profit = models.DecimalField(max_digits=14, decimal_places=2, default=0)  # stakes of won bets
+    total_loss = models.DecimalField(max_digits=14, decimal_places=2, default=0)  # stakes of lost bets
+
+    def __str__(self):
+        return f"{self.user.username}'s bet stats"
+
+
 
 class ManualControl(models.Model):
     chart_type = models.ForeignKey(ChartType, on_delete=models.CASCADE)
@@ -0,0 +1,112 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination on (created_at, id), newest first.
+
+    A page is one index range scan from the cursor position, so its cost does
+    not grow with how deep the client has scrolled. `?cursor=` continues to
+    older rows (the `next` link). `?since=` returns only rows newer than a
+    cursor, oldest first, so a client can poll for new rows with the `since`
+    link of the last response. `?limit=` sets the page size.
+    """
+
+    page_size = 50
+    max_page_size = 1000
+    cursor_query_param = 'cursor'
+    since_query_param = 'since'
+    page_size_query_param = 'limit'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.limit = self.get_page_size(request)
+        cursor = self.decode(request.query_params.get(self.cursor_query_param))
+        self.since = self.decode(request.query_params.get(self.since_query_param))
+
+        # The plain created_at bound lets the (user, created_at, id) index seek
+        # straight to the cursor; the OR only breaks ties within one timestamp
+        if self.since is not None:
+            created_at, pk = self.since
+            queryset = queryset.filter(Q(created_at__gt=created_at) | Q(id__gt=pk), created_at__gte=created_at)
+            queryset = queryset.order_by('created_at', 'id')
+        else:
+            if cursor is not None:
+                created_at, pk = cursor
+                queryset = queryset.filter(Q(created_at__lt=created_at) | Q(id__lt=pk), created_at__lte=created_at)
+            queryset = queryset.order_by('-created_at', '-id')
+
+        rows = list(queryset[:self.limit + 1])
+        self.has_more = len(rows) > self.limit
+        self.page = rows[:self.limit]
+        return self.page
+
+    def get_page_size(self, request):
+        try:
+            value = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if value > 0:
+            return min(value, self.max_page_size)
+        return self.page_size
+
+    def decode(self, value):
+        if value is None:
+            return None
+        try:
+            created_at, pk = urlsafe_b64decode(value.encode()).decode().rsplit(',', 1)
+            return datetime.fromisoformat(created_at), int(pk)
+        except (TypeError, ValueError, UnicodeDecodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    @staticmethod
+    def encode(row):
+        return urlsafe_b64encode(f'{row.created_at.isoformat()},{row.pk}'.encode()).decode()
+
+    def link(self, param, row):
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, self.cursor_query_param)
+        url = remove_query_param(url, self.since_query_param)
+        return replace_query_param(url, param, self.encode(row))
+
+    def get_next_link(self):
+        if not self.has_more:
+            return None
+        param = self.since_query_param if self.since is not None else self.cursor_query_param
+        return self.link(param, self.page[-1])
+
+    def get_since_link(self):
+        if self.since is not None:
+            # Newest row seen so far: the last one of this page, or the cursor itself
+            if self.page:
+                return self.link(self.since_query_param, self.page[-1])
+            return self.request.build_absolute_uri()
+        if self.page:
+            return self.link(self.since_query_param, self.page[0])
+        return None
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'since': self.get_since_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'since': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
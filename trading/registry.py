@@ -0,0 +1,68 @@
+import threading
+import time
+
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import ChartType
+
+
+class ChartTypeRegistry:
+    """
+    In-process symbol/id → ChartType lookup.
+
+    Chart types change rarely, so the whole table is loaded once and reused by
+    the rabbit listener, serializers and candle views. Local changes refresh it
+    through signals; changes made by another process are picked up when a
+    lookup misses (at most once per `miss_reload_interval` seconds). Chart
+    types deleted by another process still resolve until the listener's
+    write fails on the foreign key and reloads (`ingest.drop_deleted_charts`).
+    """
+
+    miss_reload_interval = 5.0
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._maps = None  # (by_symbol, by_id)
+        self._loaded_at = 0.0
+
+    def _load(self):
+        with self._lock:
+            chart_types = list(ChartType.objects.all())
+            self._maps = (
+                {c.symbol: c for c in chart_types},
+                {c.id: c for c in chart_types},
+            )
+            self._loaded_at = time.monotonic()
+            return self._maps
+
+    def _lookup(self, index, key):
+        maps = self._maps or self._load()
+        chart = maps[index].get(key)
+        if chart is None and time.monotonic() - self._loaded_at > self.miss_reload_interval:
+            chart = self._load()[index].get(key)
+        if chart is None:
+            raise ChartType.DoesNotExist(f"ChartType {key!r} does not exist")
+        return chart
+
+    def get(self, symbol):
+        return self._lookup(0, symbol)
+
+    def get_by_id(self, pk):
+        return self._lookup(1, pk)
+
+    def all(self):
+        maps = self._maps or self._load()
+        return list(maps[1].values())
+
+    def invalidate(self):
+        self._maps = None
+
+
+chart_types = ChartTypeRegistry()
+
+
+@receiver(post_save, sender=ChartType)
+@receiver(post_delete, sender=ChartType)
+def refresh_chart_types(sender, **kwargs):
+    chart_types.invalidate()
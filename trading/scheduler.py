@@ -0,0 +1,160 @@
+import asyncio
+import heapq
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from .models import Bet
+from .settlement import settle_expired, settle_ids
+
+logger = logging.getLogger(__name__)
+
+# Channel layer channel the settlement scheduler reads placed bets from
+SETTLEMENT_CHANNEL = "settlement"
+
+
+def notify_bets(bets):
+    """Hand placed bets to the settlement scheduler (after the transaction commits)."""
+    entries = [[bet.id, bet.expires_at.timestamp()] for bet in bets]
+    if not entries:
+        return
+
+    def send():
+        try:
+            async_to_sync(get_channel_layer().send)(
+                SETTLEMENT_CHANNEL, {"type": "bets.placed", "bets": entries}
+            )
+        except Exception as e:
+            # The scheduler's periodic resync still picks these bets up
+            logger.warning("Failed to notify settlement scheduler: %s", e)
+
+    transaction.on_commit(send)
+
+
+@receiver(post_save, sender=Bet)
+def schedule_placed_bet(sender, instance, created, **kwargs):
+    if created and instance.result == 'PENDING':
+        notify_bets([instance])
+
+
+class SettlementScheduler:
+    """
+    Settles bets as they expire instead of polling the table.
+
+    Pending bets are kept in a min-heap of (expires_at, id), rebuilt from the
+    database on start. Placed bets arrive on the SETTLEMENT_CHANNEL channel;
+    the scheduler sleeps until the earliest expiry (plus `delay`, see
+    SETTLEMENT_DELAY) and settles everything due in one batch. Every `resync`
+    seconds it also sweeps the table, so a lost notification delays a bet by
+    at most that long.
+    """
+
+    def __init__(self, channel_layer, delay=2.0, batch_size=1000, resync=60.0):
+        self.channel_layer = channel_layer
+        self.delay = delay
+        self.batch_size = batch_size
+        self.resync_interval = resync
+        self.heap = []  # (expires_at epoch seconds, bet id)
+        self.known = set()
+        self.wake = None
+        # Settlement runs on one thread, so batches never overlap
+        self.db_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="settlement-db")
+
+    def push(self, bet_id, expires_at):
+        if bet_id not in self.known:
+            self.known.add(bet_id)
+            heapq.heappush(self.heap, (expires_at, bet_id))
+
+    def pop_due(self, now):
+        due = []
+        while self.heap and self.heap[0][0] + self.delay <= now:
+            _, bet_id = heapq.heappop(self.heap)
+            self.known.discard(bet_id)
+            due.append(bet_id)
+        return due
+
+    def pending_bets(self, after=None):
+        bets = Bet.objects.filter(result='PENDING')
+        if after is not None:
+            bets = bets.filter(expires_at__gt=after)
+        return [(pk, expires_at.timestamp()) for pk, expires_at in bets.values_list('id', 'expires_at').iterator()]
+
+    def cutoff(self):
+        return datetime.now(dt_timezone.utc) - timedelta(seconds=self.delay)
+
+    def run(self):
+        asyncio.run(self.main())
+
+    async def main(self):
+        loop = asyncio.get_running_loop()
+        self.wake = asyncio.Event()
+
+        # Восстанавливаем кучу из базы
+        for bet_id, expires_at in await loop.run_in_executor(self.db_pool, self.pending_bets):
+            self.push(bet_id, expires_at)
+        print(f"[Settlement] Загружено ставок: {len(self.heap)}")
+
+        tasks = [asyncio.create_task(self.listen()), asyncio.create_task(self.resync())]
+        try:
+            await self.timer()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def listen(self):
+        while True:
+            message = await self.channel_layer.receive(SETTLEMENT_CHANNEL)
+            for bet_id, expires_at in message.get("bets", []):
+                self.push(bet_id, expires_at)
+            self.wake.set()
+
+    async def timer(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            timeout = None
+            if self.heap:
+                timeout = max(0.0, self.heap[0][0] + self.delay - time.time())
+            try:
+                await asyncio.wait_for(self.wake.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            self.wake.clear()
+
+            due = self.pop_due(time.time())
+            if not due:
+                continue
+            try:
+                settled, skipped = await loop.run_in_executor(
+                    self.db_pool, settle_ids, due, self.cutoff(), self.batch_size
+                )
+            except Exception as e:
+                # Ставки остаются в базе, их подберёт следующая сверка
+                print(f"[ERROR] Не удалось рассчитать {len(due)} ставок: {e}")
+                continue
+            print(f"[Settlement] Рассчитано ставок: {settled}, без цены: {skipped}")
+
+    async def resync(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.resync_interval)
+            cutoff = self.cutoff()
+            try:
+                settled, _ = await loop.run_in_executor(
+                    self.db_pool, settle_expired, cutoff, self.batch_size
+                )
+                missed = await loop.run_in_executor(self.db_pool, self.pending_bets, cutoff)
+            except Exception as e:
+                print(f"[ERROR] Сверка ставок не удалась: {e}")
+                continue
+            if settled:
+                print(f"[Settlement] Сверка: рассчитано пропущенных ставок: {settled}")
+            for bet_id, expires_at in missed:
+                self.push(bet_id, expires_at)
+            self.wake.set()
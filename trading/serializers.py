@@ -2,6 +2,7 @@ from rest_framework import serializers
 from django.contrib.auth.models import User
 from django.utils import timezone
 from .models import Candle, Bet, UserProfile, ChartType, ManualControl, CompletedBet
+from .registry import chart_types
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -24,14 +25,36 @@ class ChartTypeSerializer(serializers.ModelSerializer):
         model = ChartType
         fields = ('id', 'name', 'symbol')
 
+
+class CachedChartTypeField(serializers.PrimaryKeyRelatedField):
+    """Resolves a ChartType pk through the in-process registry instead of a query."""
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault('queryset', ChartType.objects.all())
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            return chart_types.get_by_id(int(data))
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        except ChartType.DoesNotExist:
+            self.fail('does_not_exist', pk_value=data)
+
+
 class CandleSerializer(serializers.ModelSerializer):
-    chart_type_symbol = serializers.CharField(source='chart_type.symbol', read_only=True)
+    chart_type_symbol = serializers.SerializerMethodField()
 
     class Meta:
         model = Candle
-        fields = ('id', 'chart_type', 'chart_type_symbol', 'time', 'open_price', 
+        fields = ('id', 'chart_type', 'chart_type_symbol', 'interval', 'time', 'open_price', 
                  'close_price', 'min_price', 'max_price')
 
+    def get_chart_type_symbol(self, obj):
+        return chart_types.get_by_id(obj.chart_type_id).symbol
+
     def validate(self, data):
         if data['min_price'] > data['max_price']:
             raise serializers.ValidationError("Minimum price cannot be greater than maximum price")
@@ -93,9 +116,8 @@ class ManualControlSerializer(serializers.ModelSerializer):
 class BetSerializer(serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
     chart_type = ChartTypeSerializer(read_only=True)
-    chart_type_id = serializers.PrimaryKeyRelatedField(
+    chart_type_id = CachedChartTypeField(
         source='chart_type',
-        queryset=ChartType.objects.all(),
         write_only=True
     )
 
@@ -114,16 +136,18 @@ class BetSerializer(serializers.ModelSerializer):
             'expires_at',
             'result'
         ]
-        read_only_fields = ['id', 'created_at', 'expires_at', 'result']
+        # The entry price is the latest listener price, set by BetViewSet.place
+        read_only_fields = ['id', 'entry_price', 'created_at', 'expires_at', 'result']
 
     def validate_amount(self, value):
         if value <= 0:
             raise serializers.ValidationError("Bet amount must be greater than 0")
         return value
 
-    def validate_entry_price(self, value):
-        if value <= 0:
-            raise serializers.ValidationError("Entry price must be greater than 0")
+    def validate_timeframe(self, value):
+        # A bet must expire after it is placed, or it would settle at a known past price
+        if value < 1:
+            raise serializers.ValidationError("Timeframe must be at least 1 minute")
         return value
 
     def validate_direction(self, value):
@@ -0,0 +1,214 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import F, OuterRef, Q, Subquery
+from django.db.models.functions import Mod
+
+from .models import Bet, ChartType, CompletedBet, PriceStamp, UserProfile
+from .stats import record_settled
+
+# Win pays the stake back twice (it was already debited when the bet was placed)
+PAYOUT_MULTIPLIER = Decimal('2.0')
+
+class SettlementConflict(Exception):
+    pass
+
+
+BET_FIELDS = ('id', 'user_id', 'chart_type_id', 'amount', 'direction', 'entry_price', 'expires_at')
+
+# Rows fetched per round trip while streaming ticks for the as-of lookup
+TICK_CHUNK_SIZE = 2000
+
+
+def prices_before(chart_type_ids, time):
+    """Price of the last tick at or before `time` of every chart type, in one query."""
+    last = (
+        PriceStamp.objects.filter(chart_type=OuterRef('pk'), time__lte=time)
+        .order_by('-time').values('price')[:1]
+    )
+    rows = ChartType.objects.filter(pk__in=chart_type_ids).annotate(price=Subquery(last))
+    return dict(rows.values_list('pk', 'price'))
+
+
+def closing_prices(bets):
+    """
+    As-of lookup: price of the last tick at or before each bet's `expires_at`.
+
+    The expiries of every chart type are sorted and merged against its tick
+    stream between the earliest and the latest expiry. Each stream is one
+    range scan of `pricestamp_chart_time_idx`, already in time order, so
+    rows arrive without a sort. The price in force at the earliest expiry
+    comes from one seek per chart type. Returns {bet id: price}; bets
+    without an earlier tick are missing.
+    """
+    expiries = defaultdict(list)
+    for bet in bets:
+        expiries[bet['chart_type_id']].append((bet['expires_at'], bet['id']))
+    for pending in expiries.values():
+        pending.sort()
+
+    first = min(bet['expires_at'] for bet in bets)
+    current = prices_before(list(expiries), first)
+
+    prices = {}
+    for chart_type_id, pending in expiries.items():
+        price = current[chart_type_id]
+        ticks = (
+            PriceStamp.objects.filter(chart_type_id=chart_type_id, time__gt=first, time__lte=pending[-1][0])
+            .order_by('time')
+            .values_list('time', 'price')
+            .iterator(chunk_size=TICK_CHUNK_SIZE)
+        )
+        i = 0
+        for time, tick_price in ticks:
+            # Expiries before this tick settle at the price in force until now
+            while i < len(pending) and pending[i][0] < time:
+                prices[pending[i][1]] = price
+                i += 1
+            price = tick_price
+        for _, bet_id in pending[i:]:
+            prices[bet_id] = price
+    return {bet_id: price for bet_id, price in prices.items() if price is not None}
+
+
+def settle(bets, prices):
+    """
+    Compute the outcome of a batch of bets (dicts with BET_FIELDS) in memory.
+
+    Returns (completed, payouts, settled_ids). Bets without a closing price
+    are left out and stay pending.
+    """
+    completed = []
+    payouts = defaultdict(Decimal)
+    settled_ids = []
+    for bet in bets:
+        closing_price = prices.get(bet['id'])
+        if closing_price is None:
+            continue
+
+        entry_price = bet['entry_price']
+        is_win = (closing_price > entry_price) if bet['direction'] == 'UP' else (closing_price < entry_price)
+        if is_win:
+            payouts[bet['user_id']] += bet['amount'] * PAYOUT_MULTIPLIER
+
+        completed.append(CompletedBet(
+            user_id=bet['user_id'],
+            chart_type_id=bet['chart_type_id'],
+            amount=bet['amount'],
+            direction=bet['direction'],
+            entry_price=entry_price,
+            closing_price=closing_price,
+            result='WIN' if is_win else 'LOSS',
+        ))
+        settled_ids.append(bet['id'])
+    return completed, payouts, settled_ids
+
+
+def credit(payouts):
+    """Add the payouts to the balances, one UPDATE per distinct payout total."""
+    users_by_total = defaultdict(list)
+    for user_id, total in payouts.items():
+        users_by_total[total].append(user_id)
+    for total, user_ids in users_by_total.items():
+        UserProfile.objects.filter(user_id__in=user_ids).update(balance=F('balance') + total)
+
+
+def apply(bets):
+    """
+    Settle locked pending bets: the price lookup, bulk insert of the
+    CompletedBets, the balance updates and a single DELETE. Must run inside
+    the transaction that selected them. Returns the number settled.
+    """
+    if not bets:
+        return 0
+    prices = closing_prices(bets)
+    completed, payouts, settled_ids = settle(bets, prices)
+
+    # The DELETE is the claim: a bet another worker settled first is gone (or
+    # no longer pending), and paying it again would roll the batch back
+    deleted, _ = Bet.objects.filter(id__in=settled_ids, result='PENDING').delete()
+    if deleted != len(settled_ids):
+        raise SettlementConflict(f"{len(settled_ids) - deleted} bets were settled concurrently")
+
+    CompletedBet.objects.bulk_create(completed, batch_size=len(bets))
+    credit(payouts)
+    record_settled(completed)
+    return len(settled_ids)
+
+
+def claimable():
+    """
+    Pending bets, locked for settlement. Rows locked by another worker are
+    skipped rather than waited for, so concurrent runs split the work. Bets
+    that expired before they were placed are never settled: their closing
+    price was already known when they were placed.
+    """
+    skip_locked = connection.features.has_select_for_update_skip_locked
+    return Bet.objects.select_for_update(skip_locked=skip_locked).filter(
+        result='PENDING', expires_at__gt=F('created_at')
+    )
+
+
+def settle_batch(now, after=None, batch_size=1000, partition=None):
+    """
+    Settle up to `batch_size` pending bets that expired by `now`.
+
+    Bets are taken in (expires_at, id) order after the `after` key, so a batch
+    covers a narrow expiry window and the as-of tick scan stays short. With
+    `partition` = (index, count) only bets with user_id % count == index are
+    taken. The whole batch is one transaction. Returns (last_key, fetched,
+    settled); last_key is None when nothing was left.
+    """
+    bets = claimable().filter(expires_at__lte=now)
+    if partition is not None:
+        index, count = partition
+        bets = bets.alias(partition=Mod('user_id', count)).filter(partition=index)
+    if after is not None:
+        expires_at, bet_id = after
+        bets = bets.filter(Q(expires_at__gt=expires_at) | Q(expires_at=expires_at, id__gt=bet_id))
+
+    with transaction.atomic():
+        bets = list(bets.order_by('expires_at', 'id').values(*BET_FIELDS)[:batch_size])
+        if not bets:
+            return None, 0, 0
+        settled = apply(bets)
+
+    last = bets[-1]
+    return (last['expires_at'], last['id']), len(bets), settled
+
+
+def settle_ids(ids, now, batch_size=1000):
+    """
+    Settle the given bets if they are still pending and expired by `now`,
+    `batch_size` per transaction. Returns (settled, skipped).
+    """
+    ids = list(ids)
+    settled = skipped = 0
+    for i in range(0, len(ids), batch_size):
+        with transaction.atomic():
+            bets = list(
+                claimable().filter(id__in=ids[i:i + batch_size], expires_at__lte=now).values(*BET_FIELDS)
+            )
+            done = apply(bets)
+        settled += done
+        skipped += len(bets) - done
+    return settled, skipped
+
+
+def settle_expired(now, batch_size=1000, partition=None):
+    """
+    Settle every bet that expired by `now` (of one `partition`, if given),
+    batch by batch. Returns (settled, skipped).
+    """
+    after = None
+    settled = skipped = 0
+    while True:
+        after, fetched, done = settle_batch(now, after, batch_size, partition)
+        if after is None:
+            break
+        settled += done
+        skipped += fetched - done
+        if fetched < batch_size:
+            break
+    return settled, skipped
@@ -0,0 +1,132 @@
+import logging
+import time
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .candles import INTERVALS
+from .httpcache import bump_candles_versions
+from .models import Candle
+from .registry import chart_types
+
+logger = logging.getLogger(__name__)
+
+LABELS = {seconds: label for label, seconds in INTERVALS.items()}
+
+
+def candles_key(symbol, interval):
+    return f"snapshot:candles:{symbol}:{interval}"
+
+
+def price_key(symbol):
+    return f"snapshot:price:{symbol}"
+
+
+def candle_to_dict(candle):
+    return {
+        'time': candle.time.isoformat(),
+        'open_price': candle.open_price,
+        'close_price': candle.close_price,
+        'min_price': candle.min_price,
+        'max_price': candle.max_price,
+    }
+
+
+def record_candles(candles):
+    """Append closed candles to the per-symbol/interval ring buffers."""
+    grouped = {}
+    for candle in candles:
+        key = candles_key(candle.chart_type.symbol, candle.interval)
+        grouped.setdefault(key, []).append(candle_to_dict(candle))
+    if not grouped:
+        return
+    bump_candles_versions(candle.chart_type_id for candle in candles)
+
+    size = settings.PRICE_SNAPSHOT_CANDLES
+    try:
+        current = cache.get_many(list(grouped))
+        cache.set_many(
+            {key: (current.get(key, []) + new)[-size:] for key, new in grouped.items()},
+            timeout=None,
+        )
+    except Exception as e:
+        logger.warning("Failed to update candle snapshots: %s", e)
+
+
+def record_prices(ticks):
+    try:
+        cache.set_many({price_key(t["chart_type"]): t for t in ticks}, timeout=None)
+    except Exception as e:
+        logger.warning("Failed to update latest prices: %s", e)
+
+
+async def arecord_prices(ticks):
+    try:
+        await cache.aset_many({price_key(t["chart_type"]): t for t in ticks}, timeout=None)
+    except Exception as e:
+        logger.warning("Failed to update latest prices: %s", e)
+
+
+def latest_prices(symbols):
+    """Latest listener tick of every symbol that has one: {symbol: tick}."""
+    try:
+        values = cache.get_many([price_key(symbol) for symbol in symbols])
+    except Exception as e:
+        logger.warning("Failed to read latest prices: %s", e)
+        return {}
+    return {tick["chart_type"]: tick for tick in values.values()}
+
+
+def tick_price(tick, max_age=None):
+    """Decimal price of `tick`, or None if it is missing, malformed or older than `max_age` seconds."""
+    try:
+        if max_age and time.time() * 1000 - tick.get("ts", 0) > max_age * 1000:
+            return None
+        price = Decimal(str(tick["price"]))
+    except (AttributeError, KeyError, TypeError, InvalidOperation):
+        return None
+    return price if price.is_finite() else None
+
+
+def latest_price(symbol, max_age=None):
+    """Decimal price of the latest tick of `symbol` (see `tick_price`); None if the cache is down."""
+    try:
+        tick = cache.get(price_key(symbol))
+    except Exception as e:
+        logger.warning("Failed to read latest price of %s: %s", symbol, e)
+        return None
+    return tick_price(tick, max_age)
+
+
+def seed_snapshots():
+    """Fill the ring buffers from the database, e.g. when the listener starts."""
+    size = settings.PRICE_SNAPSHOT_CANDLES
+    values = {}
+    for chart in chart_types.all():
+        for interval in INTERVALS.values():
+            candles = list(
+                Candle.objects.filter(chart_type=chart, interval=interval).order_by('-time')[:size]
+            )
+            values[candles_key(chart.symbol, interval)] = [candle_to_dict(c) for c in reversed(candles)]
+    try:
+        cache.set_many(values, timeout=None)
+    except Exception as e:
+        logger.warning("Failed to seed candle snapshots: %s", e)
+
+
+async def get_snapshot(symbol, interval):
+    """First frame for a new subscriber: recent candles and the latest tick of `symbol`."""
+    ckey, pkey = candles_key(symbol, interval), price_key(symbol)
+    try:
+        values = await cache.aget_many([ckey, pkey])
+    except Exception as e:
+        logger.warning("Failed to read snapshot for %s: %s", symbol, e)
+        values = {}
+    return {
+        "type": "snapshot",
+        "symbol": symbol,
+        "interval": LABELS[interval],
+        "candles": values.get(ckey, []),
+        "price": values.get(pkey),
+    }
@@ -0,0 +1,57 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import connection
+
+from .models import BetStats
+
+# Users per statement when applying settlement deltas (5 parameters each)
+UPDATE_CHUNK = 500
+
+COUNTERS = ('wins', 'losses')
+AMOUNTS = ('total_profit', 'total_loss')
+
+
+def settled_deltas(completed):
+    """Per-user changes for a batch of CompletedBets: {user_id: {field: delta}}."""
+    deltas = defaultdict(lambda: dict.fromkeys(COUNTERS, 0) | dict.fromkeys(AMOUNTS, Decimal(0)))
+    for bet in completed:
+        delta = deltas[bet.user_id]
+        if bet.result == 'WIN':
+            delta['wins'] += 1
+            delta['total_profit'] += bet.amount
+        else:
+            delta['losses'] += 1
+            delta['total_loss'] += bet.amount
+    return deltas
+
+
+def record_settled(completed):
+    """
+    Apply a settlement batch to the stats with one INSERT ... ON CONFLICT DO
+    UPDATE per UPDATE_CHUNK users, adding the deltas to the existing row (or
+    creating it for a user's first settled bet).
+    """
+    deltas = settled_deltas(completed)
+    if not deltas:
+        return
+
+    table = connection.ops.quote_name(BetStats._meta.db_table)
+    fields = COUNTERS + AMOUNTS
+    columns = ', '.join(['user_id', *fields])
+    updates = ', '.join(f'{field} = {table}.{field} + excluded.{field}' for field in fields)
+    row = '(' + ', '.join(['%s'] * (len(fields) + 1)) + ')'
+
+    user_ids = list(deltas)
+    with connection.cursor() as cursor:
+        for i in range(0, len(user_ids), UPDATE_CHUNK):
+            chunk = user_ids[i:i + UPDATE_CHUNK]
+            params = []
+            for user_id in chunk:
+                params.append(user_id)
+                params.extend(deltas[user_id][field] for field in fields)
+            cursor.execute(
+                f'INSERT INTO {table} ({columns}) VALUES {", ".join([row] * len(chunk))} '
+                f'ON CONFLICT (user_id) DO UPDATE SET {updates}',
+                params,
+            )
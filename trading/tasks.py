@@ -4,67 +4,51 @@ import random
 from celery import shared_task
 from django.db.models.expressions import result
 from django.utils import timezone
-from django.db import transaction
-from decimal import Decimal
-from .models import Bet, PriceStamp, CompletedBet
+from django.conf import settings
+from django.db import OperationalError, connection
+from .settlement import SettlementConflict, settle_expired
 import logging
-from datetime import datetime
+from datetime import datetime, timedelta, timezone as dt_timezone
 logger = logging.getLogger(__name__)
 
 
 @shared_task
 def process_bets():
     print("Starting bet processing")
-    now = timezone.now()
-
-    pending_bets = Bet.objects.filter(
-        result="PENDING",
-        expires_at__lte=now
-    ).select_related("user__userprofile", "chart_type")
-
-    print(f"Found {pending_bets.count()} bets")
-
-    for bet in pending_bets:
-        try:
-            with transaction.atomic():
-                latest_price = PriceStamp.objects.filter(
-                    chart_type=bet.chart_type
-                ).order_by("-time").first()
-
-                if not latest_price:
-                    print(f"No price found for bet {bet.id} skipping")
-                    continue
-
-                closing_price = latest_price.price
-                entry_price = bet.entry_price
-
-                is_win = (closing_price > entry_price) if bet.direction == "UP" else (closing_price < entry_price)
-                result = 'WIN' if is_win else 'LOSS'
-
-                user_profile = bet.user.userprofile
-                if is_win:
-                    profit = bet.amount() * Decimal('2.0')
-                    user_profile.balance += profit
-                    user_profile.save()
+    # Ticks of the last moment may still be on their way through the listener
+    now = timezone.now() - timedelta(seconds=settings.SETTLEMENT_DELAY)
+    partitions = settings.SETTLEMENT_PARTITIONS
+    if not connection.features.has_select_for_update_skip_locked:
+        # SQLite has one write lock: concurrent partitions would only fail
+        # with "database is locked" when they upgrade their read locks
+        partitions = 1
+
+    if partitions > 1:
+        # Each partition (user_id % partitions) settles on its own worker
+        for index in range(partitions):
+            settle_partition.delay(index, partitions, now.timestamp())
+        print(f"Queued settlement of {partitions} partitions")
+        return
+
+    settled, skipped = settle_expired(now, batch_size=settings.SETTLEMENT_BATCH_SIZE)
+
+    print(f"Settled {settled} bets, {skipped} left pending (no price at expiry)")
+    print("=== Bet processing completed ===\n")
 
-            CompletedBet.objects.create(
-                user=bet.user,
-                chart_type=bet.chart_type,
-                amount=bet.amount,
-                direction=bet.direction,
-                entry_price=bet.entry_price,
-                closing_price=closing_price,
-                result=result
-            )
 
-            bet.delete()
+@shared_task(bind=True, max_retries=3)
+def settle_partition(self, index, partitions, now):
+    now = datetime.fromtimestamp(now, tz=dt_timezone.utc)
+    try:
+        settled, skipped = settle_expired(
+            now, batch_size=settings.SETTLEMENT_BATCH_SIZE, partition=(index, partitions)
+        )
+    except (OperationalError, SettlementConflict) as e:
+        # The failed batch rolled back; batches settled before it stay settled
+        raise self.retry(exc=e, countdown=1)
+    print(f"Partition {index}/{partitions}: settled {settled} bets, {skipped} left pending (no price at expiry)")
 
-            print(f"Bet {bet.id} processed: {result} | User: {bet.user.username} | Balance: {user_profile.balance}")
 
-        except Exception as e:
-            logger.error(f"Error processing bet {bet.id}: {str(e)}")
-            print(f"Error processing bet {bet.id}: {str(e)}")
-    print("=== Bet processing completed ===\n")
 # @shared_task
 # def process_bets():
 #     print("\n=== Starting bet processing... ===")
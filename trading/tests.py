@@ -1,3 +1,779 @@
-from django.test import TestCase
+import asyncio
+import json
+import re
+import time
+import unittest
+import warnings
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIHandler
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .candles import CandleRollup, query_candle_columns, query_candles, restore_rollup, save_candles
+from .export import EXPORT_FLUSH_ROWS, tick_rows
+from .ingest import AsyncListener, write_ticks
+from .models import Bet, BetStats, Candle, CandleCheckpoint, ChartType, CompletedBet, PriceStamp, UserProfile
+from .registry import chart_types
+from .scheduler import SETTLEMENT_CHANNEL, SettlementScheduler
+from .settlement import BET_FIELDS, SettlementConflict, apply, closing_prices, settle_expired, settle_ids
+from .broadcast import PriceBroadcaster
+from .snapshots import latest_price, price_key, record_prices
+
+# Tables that grow without bound; a full scan of any of them is a regression
+HOT_TABLES = ('trading_bet', 'trading_completedbet', 'trading_candle', 'trading_pricestamp')
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', 'plans are checked with SQLite EXPLAIN QUERY PLAN')
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+)
+class QueryPlanTests(TestCase):
+    """
+    Runs the hot paths of views.py, tasks.py and the listener, then EXPLAINs
+    every query they sent and fails if one of them scans a hot table.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        cls.user = User.objects.create_user('trader', password='x')
+        # Two chart types, so batches span several tick streams
+        cls.chart = ChartType.objects.create(name='Bitcoin', symbol='BTC')
+        cls.other_chart = ChartType.objects.create(name='Ethereum', symbol='ETH')
+        charts = (cls.chart, cls.other_chart)
+        PriceStamp.objects.bulk_create([
+            PriceStamp(chart_type=chart, price=Decimal(100 + i), time=now - timedelta(seconds=i))
+            for chart in charts for i in range(200)
+        ])
+        Candle.objects.bulk_create([
+            Candle(
+                chart_type=chart, interval=interval, time=now - timedelta(seconds=interval * i),
+                open_price=1, close_price=2, min_price=0, max_price=3,
+            )
+            for chart in charts for interval in (5, 3600) for i in range(50)
+        ])
+        create_bets([
+            Bet(
+                user=cls.user, chart_type=charts[i % 2], amount=1, direction='UP', entry_price=150,
+                expires_at=now + timedelta(seconds=i - 100),
+            )
+            for i in range(200)
+        ])
+        CompletedBet.objects.bulk_create([
+            CompletedBet(
+                user=cls.user, chart_type=charts[i % 2], amount=1, direction='UP', entry_price=1,
+                closing_price=2, result='WIN',
+            )
+            for i in range(100)
+        ])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def assertNoFullScans(self, queries):
+        """Fail on a full scan of a hot table, or on a temp B-tree sort of its rows."""
+        checked = 0
+        with connection.cursor() as cursor:
+            for query in queries:
+                sql = query['sql']
+                if not re.match(r'\s*(SELECT|UPDATE|DELETE)\b', sql, re.IGNORECASE):
+                    continue
+                checked += 1
+                # Subqueries name their tables by alias ("trading_bet" U0)
+                names = {alias: table for table, alias in re.findall(r'"(\w+)" (U\d+)\b', sql)}
+                plan = cursor.execute('EXPLAIN QUERY PLAN ' + sql).fetchall()
+                report = f'{sql}\n' + '\n'.join(row[-1] for row in plan)
+
+                children = {}
+                for row_id, parent, _, detail in plan:
+                    children.setdefault(parent, []).append((row_id, detail))
+
+                def tables(row_id, detail):
+                    match = re.match(r'(?:SCAN|SEARCH) (\w+)', detail)
+                    found = {names.get(match.group(1), match.group(1))} if match else set()
+                    for child in children.get(row_id, []):
+                        found |= tables(*child)
+                    return found
+
+                for row_id, parent, _, detail in plan:
+                    match = re.match(r'SCAN (\w+)', detail)
+                    if match and names.get(match.group(1), match.group(1)) in HOT_TABLES:
+                        self.fail(f'Full scan of {match.group(1)}:\n{report}')
+                    if detail.startswith('USE TEMP B-TREE'):
+                        # The sort covers the rows of the tables read at the same level
+                        sorted_tables = set()
+                        for sibling in children[parent]:
+                            sorted_tables |= tables(*sibling)
+                        if sorted_tables & set(HOT_TABLES):
+                            self.fail(f'Temp B-tree sort of {sorted(sorted_tables & set(HOT_TABLES))}:\n{report}')
+        self.assertTrue(checked, 'no queries were checked')
+
+    def capture(self, run):
+        with CaptureQueriesContext(connection) as queries:
+            run()
+        self.assertNoFullScans(queries.captured_queries)
+
+    def test_bet_history_pages(self):
+        def run():
+            for url in ('/api/bets/?limit=20', '/api/completed-bets/?limit=20'):
+                page = self.client.get(url).json()
+                self.client.get(page['next'])
+                self.client.get(page['since'])
+        self.capture(run)
+
+    def test_candles(self):
+        def run():
+            for params in ({'interval': '5s'}, {'interval': '15s', 'limit': 100}, {'interval': '4h', 'format': 'columnar'}):
+                self.client.get('/api/candles/', {'chart_type': self.chart.id, **params})
+        self.capture(run)
+
+    def test_export(self):
+        def run():
+            response = self.client.get('/api/export/ticks/', {'symbol': 'BTC'})
+            lines = b''.join(response.streaming_content).splitlines()
+            self.assertEqual(len(lines), 200)
+            self.assertEqual(list(json.loads(lines[0])), ['time', 'price'])
+
+            response = self.client.get('/api/export/candles/', {'symbol': 'BTC', 'interval': '4h', 'format': 'csv'})
+            lines = b''.join(response.streaming_content).decode().splitlines()
+            self.assertEqual(lines[0], 'time,open,high,low,close')
+            self.assertGreater(len(lines), 1)
+        self.capture(run)
+
+    def test_place_and_statistics(self):
+        record_prices([{'type': 'message', 'chart_type': 'BTC', 'price': '150', 'ts': int(time.time() * 1000)}])
+
+        def run():
+            response = self.client.post(
+                '/api/bets/place/', {'chart_type_id': self.chart.id, 'amount': '1', 'direction': 'UP'}
+            )
+            self.assertEqual(response.status_code, 201)
+            response = self.client.post('/api/bets/place-batch/', [
+                {'chart_type_id': self.chart.id, 'amount': '1', 'direction': 'DOWN'},
+            ], format='json')
+            self.assertEqual(response.status_code, 201)
+            self.client.get('/api/bets/statistics/')
+        self.capture(run)
+
+    def test_settlement(self):
+        now = timezone.now()
+        ids = list(Bet.objects.values_list('id', flat=True)[:10])
+
+        def run():
+            settled, _ = settle_expired(now - timedelta(seconds=60), batch_size=20)
+            self.assertTrue(settled)
+            settle_expired(now, batch_size=20, partition=(0, 2))
+            settle_ids(ids, now)
+        self.capture(run)
+
+    def test_scheduler_and_listener_restore(self):
+        def run():
+            SettlementScheduler(None).pending_bets(timezone.now())
+            restore_rollup(CandleRollup(), timezone.now())
+        self.capture(run)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class ExportStreamingTests(TransactionTestCase):
+    """The export must go out chunk by chunk under ASGI (daphne), not be built first."""
+
+    ticks = EXPORT_FLUSH_ROWS * 4
+
+    def setUp(self):
+        now = timezone.now()
+        self.user = User.objects.create_user('trader', password='x')
+        chart = ChartType.objects.create(name='Bitcoin', symbol='BTC')
+        PriceStamp.objects.bulk_create([
+            PriceStamp(chart_type=chart, price=Decimal(100 + i), time=now - timedelta(seconds=i))
+            for i in range(self.ticks)
+        ])
+
+    def test_asgi_streams_while_reading(self):
+        read = []
+
+        def counted_tick_rows(*args):
+            for row in tick_rows(*args):
+                read.append(row)
+                yield row
+
+        token = RefreshToken.for_user(self.user).access_token
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+            'scheme': 'http', 'path': '/api/export/ticks/', 'root_path': '', 'query_string': b'symbol=BTC',
+            'headers': [(b'host', b'testserver'), (b'authorization', f'Bearer {token}'.encode())],
+            'server': ('testserver', 80), 'client': ('127.0.0.1', 5000),
+        }
+        messages = []
+        read_at_send = []
+
+        requested = []
+
+        async def receive():
+            if not requested:
+                requested.append(True)
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+            # The client stays connected until the response is done
+            await asyncio.Event().wait()
+
+        async def send(message):
+            if message['type'] == 'http.response.body' and message.get('body'):
+                read_at_send.append(len(read))
+            messages.append(message)
+
+        with warnings.catch_warnings(record=True) as caught, \
+                mock.patch('trading.views.tick_rows', counted_tick_rows):
+            warnings.simplefilter('always')
+            async_to_sync(ASGIHandler())(scope, receive, send)
+
+        self.assertEqual(messages[0]['status'], 200)
+        body = b''.join(message.get('body', b'') for message in messages[1:])
+        self.assertEqual(len(body.splitlines()), self.ticks)
+        # The first chunk went out before the rest of the range was read
+        self.assertGreater(len(read_at_send), 1)
+        self.assertLess(read_at_send[0], self.ticks)
+        self.assertFalse([w for w in caught if 'synchronous iterators' in str(w.message)])
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class DeletedChartTypeTests(TransactionTestCase):
+    """A chart type deleted by another process must not wedge the listener."""
+
+    def test_ticks_of_a_deleted_chart_type_are_dropped(self):
+        ChartType.objects.create(name='Bitcoin', symbol='BTC')
+        ChartType.objects.create(name='Ethereum', symbol='ETH')
+        rollup = CandleRollup()
+        now = timezone.now()
+
+        def batch():
+            return [
+                ({'type': 'message', 'chart_type': symbol, 'price': '100'}, now)
+                for symbol in ('BTC', 'ETH')
+            ]
+
+        self.assertEqual(write_ticks(rollup, batch(), now)[0], 2)
+
+        # The web process deletes ETH; this process' registry still has it
+        stale = chart_types._maps
+        ChartType.objects.filter(symbol='ETH').delete()
+        chart_types._maps = stale
+
+        with self.assertRaises(IntegrityError):
+            write_ticks(rollup, batch(), now)
+        self.assertNotIn('ETH', rollup.last_tick)
+
+        # The requeued batch goes through without the deleted chart type
+        self.assertEqual(write_ticks(rollup, batch(), now)[0], 1)
+        self.assertEqual(PriceStamp.objects.filter(chart_type__symbol='BTC').count(), 2)
+
+
+def ohlc(candle):
+    return candle.time, candle.open_price, candle.max_price, candle.min_price, candle.close_price
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class CandleRollupTests(TestCase):
+    base = datetime(2026, 1, 1, 12, 0, tzinfo=dt_timezone.utc)
+
+    def setUp(self):
+        self.chart = ChartType.objects.create(name='Bitcoin', symbol='BTC')
+
+    def at(self, seconds):
+        return self.base + timedelta(seconds=seconds)
+
+    def test_buckets_are_wall_clock_aligned(self):
+        rollup = CandleRollup()
+        rollup.add(self.chart, 10, self.at(3.5))
+        rollup.add(self.chart, 12, self.at(4.9))
+        for interval in (5, 60, 3600, 86400):
+            chart, candle = rollup.open[('BTC', interval)]
+            self.assertEqual(candle.start.timestamp() % interval, 0)
+            self.assertEqual((candle.open, candle.close), (10, 12))
+        self.assertEqual(rollup.open[('BTC', 5)][1].start, self.at(0))
+
+    def test_later_tick_closes_the_bucket(self):
+        rollup = CandleRollup()
+        self.assertEqual(rollup.add(self.chart, 10, self.at(1)), [])
+        rollup.add(self.chart, 14, self.at(2))
+        rollup.add(self.chart, 9, self.at(3))
+        closed = rollup.add(self.chart, 11, self.at(7))
+        self.assertEqual([(c.interval, *ohlc(c)) for c in closed], [(5, self.at(0), 10, 14, 9, 9)])
+        # A late tick for the closed window is not folded into the next bucket
+        self.assertEqual(rollup.add(self.chart, 100, self.at(4)), [])
+        self.assertEqual(rollup.open[('BTC', 5)][1].high, 11)
+
+    def test_close_expired(self):
+        rollup = CandleRollup()
+        rollup.add(self.chart, 10, self.at(61))
+        self.assertEqual(rollup.close_expired(self.at(64.9)), [])
+        closed = rollup.close_expired(self.at(65))
+        self.assertEqual([(c.interval, c.time) for c in closed], [(5, self.at(60))])
+        closed = rollup.close_expired(self.at(120))
+        self.assertEqual([(c.interval, c.time) for c in closed], [(60, self.at(60))])
+        # Quiet buckets are closed once, not reopened empty
+        self.assertEqual(rollup.close_expired(self.at(125)), [])
+
+    def test_restore_from_checkpoint_and_replay(self):
+        prices = [(1, 10), (3, 12), (6, 8), (8, 9), (12, 15), (14, 7), (21, 11)]
+        reference = CandleRollup()
+        expected = []
+        for seconds, price in prices:
+            expected += reference.add(self.chart, price, self.at(seconds))
+
+        # The listener checkpoints after the first four ticks, then writes
+        # three more PriceStamps and dies before the next checkpoint
+        rollup = CandleRollup()
+        write_ticks(rollup, [
+            ({'type': 'message', 'chart_type': 'BTC', 'price': str(price)}, self.at(seconds))
+            for seconds, price in prices[:4]
+        ], self.at(8))
+        PriceStamp.objects.bulk_create([
+            PriceStamp(chart_type=self.chart, price=price, time=self.at(seconds)) for seconds, price in prices[4:]
+        ])
+
+        restored = CandleRollup()
+        save_candles(restore_rollup(restored, self.at(21.5)))
+
+        self.assertEqual(
+            {key: (c.start, c.open, c.high, c.low, c.close) for key, (_, c) in restored.open.items()},
+            {key: (c.start, c.open, c.high, c.low, c.close) for key, (_, c) in reference.open.items()},
+        )
+        stored = Candle.objects.filter(chart_type=self.chart).order_by('interval', 'time')
+        self.assertEqual(
+            [(c.interval, *ohlc(c)) for c in stored],
+            sorted((c.interval, *ohlc(c)) for c in expected),
+        )
+        self.assertTrue(CandleCheckpoint.objects.exists())
+
+
+
+class CandleQueryTests(TestCase):
+    end = datetime(2026, 1, 1, 12, 0, tzinfo=dt_timezone.utc)
+
+    def setUp(self):
+        self.chart = ChartType.objects.create(name='Bitcoin', symbol='BTC')
+
+    def minutes_ago(self, *minutes):
+        Candle.objects.bulk_create([
+            Candle(
+                chart_type=self.chart, interval=60, time=self.end - timedelta(minutes=m),
+                open_price=m, close_price=m, min_price=m, max_price=m,
+            )
+            for m in minutes
+        ])
+
+    def test_limit_counts_candles_across_gaps(self):
+        # 2m buckets at -2, -4, -12, -20 and -22 minutes; the ones between are empty
+        self.minutes_ago(1, 2, 3, 4, 11, 12, 19, 20, 21, 22)
+        candles = query_candles(self.chart.id, 120, self.end, 4)
+        self.assertEqual(
+            [ohlc(c) for c in candles],
+            [
+                (self.end - timedelta(minutes=2), 2, 2, 1, 1),
+                (self.end - timedelta(minutes=4), 4, 4, 3, 3),
+                (self.end - timedelta(minutes=12), 12, 12, 11, 11),
+                (self.end - timedelta(minutes=20), 20, 20, 19, 19),
+            ],
+        )
+        # Stored intervals count the same way
+        self.assertEqual(len(query_candles(self.chart.id, 60, self.end, 4)), 4)
+        # `from` still bounds the range
+        self.assertEqual(len(query_candles(self.chart.id, 120, self.end, 4, self.end - timedelta(minutes=5))), 2)
+
+    def test_columnar_matches_rows(self):
+        self.minutes_ago(1, 2, 10, 11, 30, 31, 32)
+        for interval in (60, 120):
+            rows = query_candles(self.chart.id, interval, self.end, 4)[::-1]
+            expected = {
+                'time': [int(c.time.timestamp()) for c in rows],
+                'open': [c.open_price for c in rows],
+                'high': [c.max_price for c in rows],
+                'low': [c.min_price for c in rows],
+                'close': [c.close_price for c in rows],
+            }
+            self.assertEqual(len(rows), 4)
+            self.assertEqual(query_candle_columns(self.chart.id, interval, self.end, 4), expected)
+            with mock.patch('trading.candles.np', None):
+                self.assertEqual(query_candle_columns(self.chart.id, interval, self.end, 4), expected)
+
+
+class FailingBroadcaster:
+    rate = 0
+
+    async def apublish(self, data):
+        raise ConnectionError('channel layer is down')
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class AsyncListenerTests(TransactionTestCase):
+    def test_broadcast_errors_do_not_stop_the_shard(self):
+        ChartType.objects.create(name='Bitcoin', symbol='BTC')
+        listener = AsyncListener(None, None, FailingBroadcaster(), shards=1, db_workers=1)
+
+        async def run():
+            listener.queues = [asyncio.Queue()]
+            worker = asyncio.create_task(listener.worker(0))
+            for batch in range(2):
+                listener.queues[0].put_nowait(
+                    ({'type': 'message', 'chart_type': 'BTC', 'price': '100'}, timezone.now(), f'message-{batch}')
+                )
+                for _ in range(100):
+                    if len(listener.settled) > batch:
+                        break
+                    await asyncio.sleep(0.05)
+            done = worker.done()
+            worker.cancel()
+            return done
+
+        self.assertFalse(asyncio.run(run()))
+        # Both batches were stored and acked although nothing could be broadcast
+        self.assertEqual(list(listener.settled), [('message-0', True), ('message-1', True)])
+        self.assertEqual(PriceStamp.objects.count(), 2)
+        listener.db_pool.shutdown()
+
+
+def create_bets(bets):
+    """bulk_create `bets` as if each was placed a minute before it expires."""
+    bets = Bet.objects.bulk_create(bets)
+    Bet.objects.filter(id__in=[bet.id for bet in bets]).update(created_at=F('expires_at') - timedelta(minutes=1))
+    return bets
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class SettlementTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.start = timezone.now() - timedelta(minutes=10)
+        cls.alice = User.objects.create_user('alice')
+        cls.bob = User.objects.create_user('bob')
+        cls.chart = ChartType.objects.create(name='Bitcoin', symbol='BTC')
+        PriceStamp.objects.bulk_create([
+            PriceStamp(chart_type=cls.chart, price=100, time=cls.at(10)),
+            PriceStamp(chart_type=cls.chart, price=110, time=cls.at(20)),
+        ])
+
+    @classmethod
+    def at(cls, seconds):
+        return cls.start + timedelta(seconds=seconds)
+
+    def bet(self, user, direction, entry_price, expires, amount=10):
+        return Bet(
+            user=user, chart_type=self.chart, amount=amount, direction=direction,
+            entry_price=entry_price, expires_at=self.at(expires),
+        )
+
+    def balance(self, user):
+        return UserProfile.objects.get(user=user).balance
+
+    def test_outcomes_and_payouts(self):
+        win_up, lose_down, lose_up, win_down, unpriced = create_bets([
+            self.bet(self.alice, 'UP', 105, 25, amount=10),
+            self.bet(self.alice, 'DOWN', 105, 25, amount=7),
+            self.bet(self.bob, 'UP', 110, 25, amount=3),  # closing == entry is a loss
+            self.bet(self.bob, 'DOWN', 105, 15, amount=4),
+            self.bet(self.bob, 'UP', 1, 5),  # before the first tick
+        ])
+        alice, bob = self.balance(self.alice), self.balance(self.bob)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(settle_expired(timezone.now()), (4, 1))
+
+        results = {
+            (row.user_id, row.direction, row.amount): (row.result, row.closing_price)
+            for row in CompletedBet.objects.all()
+        }
+        self.assertEqual(results, {
+            (self.alice.id, 'UP', 10): ('WIN', 110),
+            (self.alice.id, 'DOWN', 7): ('LOSS', 110),
+            (self.bob.id, 'UP', 3): ('LOSS', 110),
+            (self.bob.id, 'DOWN', 4): ('WIN', 100),
+        })
+        # Stakes were debited at placement; a win pays twice the stake
+        self.assertEqual(self.balance(self.alice), alice + 20)
+        self.assertEqual(self.balance(self.bob), bob + 8)
+        self.assertEqual(list(Bet.objects.values_list('id', flat=True)), [unpriced.id])
+        deletes = [q for q in queries.captured_queries if q['sql'].startswith('DELETE FROM "trading_bet"')]
+        self.assertEqual(len(deletes), 1)
+
+        stats = BetStats.objects.get(user=self.alice)
+        self.assertEqual((stats.wins, stats.losses, stats.total_profit, stats.total_loss), (1, 1, 10, 7))
+
+    def test_bets_settle_once(self):
+        bet, = create_bets([self.bet(self.alice, 'UP', 105, 25)])
+        balance = self.balance(self.alice)
+        self.assertEqual(settle_ids([bet.id], timezone.now()), (1, 0))
+        self.assertEqual(settle_ids([bet.id], timezone.now()), (0, 0))
+        self.assertEqual(settle_expired(timezone.now()), (0, 0))
+        self.assertEqual(self.balance(self.alice), balance + 20)
+        self.assertEqual(CompletedBet.objects.count(), 1)
+
+    def test_concurrent_claim_rolls_the_batch_back(self):
+        first, second = create_bets([
+            self.bet(self.alice, 'UP', 105, 25), self.bet(self.bob, 'UP', 105, 25),
+        ])
+        bets = list(Bet.objects.order_by('id').values(*BET_FIELDS))
+        balances = self.balance(self.alice), self.balance(self.bob)
+
+        # Another worker settles the second bet between our SELECT and DELETE
+        Bet.objects.filter(id=second.id).delete()
+        with self.assertRaises(SettlementConflict):
+            with transaction.atomic():
+                apply(bets)
+
+        self.assertEqual((self.balance(self.alice), self.balance(self.bob)), balances)
+        self.assertFalse(CompletedBet.objects.exists())
+        self.assertTrue(Bet.objects.filter(id=first.id, result='PENDING').exists())
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class PastExpiryTests(TestCase):
+    """A bet that expires before it is placed would settle at a price already known."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('trader')
+        self.chart = ChartType.objects.create(name='Bitcoin', symbol='BTC')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        # The price went 100 → 150
+        PriceStamp.objects.create(chart_type=self.chart, price=100, time=timezone.now() - timedelta(minutes=10))
+        PriceStamp.objects.create(chart_type=self.chart, price=150, time=timezone.now())
+        record_prices([{'type': 'message', 'chart_type': 'BTC', 'price': '150', 'ts': int(time.time() * 1000)}])
+
+    def test_non_positive_timeframes_are_rejected(self):
+        for timeframe in (-5, 0):
+            item = {'chart_type_id': self.chart.id, 'amount': '100', 'direction': 'DOWN', 'timeframe': timeframe}
+            response = self.client.post('/api/bets/place/', item)
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('timeframe', response.data)
+
+            response = self.client.post('/api/bets/place-batch/', [item], format='json')
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('timeframe', response.data['results'][0]['errors'])
+
+        self.assertFalse(Bet.objects.exists())
+        self.assertEqual(UserProfile.objects.get(user=self.user).balance, 1000)
+
+    def test_bets_expiring_before_placement_are_not_settled(self):
+        bet = Bet.objects.create(
+            user=self.user, chart_type=self.chart, amount=100, direction='DOWN', entry_price=150,
+            expires_at=timezone.now() - timedelta(minutes=5),
+        )
+        self.assertEqual(settle_expired(timezone.now()), (0, 0))
+        self.assertEqual(settle_ids([bet.id], timezone.now()), (0, 0))
+        self.assertFalse(CompletedBet.objects.exists())
+        self.assertEqual(UserProfile.objects.get(user=self.user).balance, 1000)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class ClosingPriceTests(TestCase):
+    """As-of lookup: the last tick at or before each expiry."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.start = timezone.now() - timedelta(hours=1)
+        cls.btc = ChartType.objects.create(name='Bitcoin', symbol='BTC')
+        cls.eth = ChartType.objects.create(name='Ethereum', symbol='ETH')
+        PriceStamp.objects.bulk_create([
+            PriceStamp(chart_type=chart, price=price, time=cls.at(seconds))
+            for chart, ticks in ((cls.btc, [(10, 100), (20, 110), (30, 120)]), (cls.eth, [(15, 5), (25, 6)]))
+            for seconds, price in ticks
+        ])
+
+    @classmethod
+    def at(cls, seconds):
+        return cls.start + timedelta(seconds=seconds)
+
+    def prices(self, expiries):
+        bets = [
+            {'id': i, 'chart_type_id': chart.id, 'expires_at': self.at(seconds)}
+            for i, (chart, seconds) in enumerate(expiries)
+        ]
+        prices = closing_prices(bets)
+        return [prices.get(i) for i in range(len(bets))]
+
+    def test_one_chart_type(self):
+        self.assertEqual(self.prices([
+            (self.btc, 5),   # before the first tick
+            (self.btc, 10),  # exactly on a tick
+            (self.btc, 15),  # between ticks
+            (self.btc, 20),
+            (self.btc, 45),  # after the last tick
+        ]), [None, 100, 100, 110, 120])
+
+    def test_unsorted_batch_over_several_chart_types(self):
+        self.assertEqual(self.prices([
+            (self.eth, 26), (self.btc, 29.9), (self.eth, 14), (self.btc, 30), (self.eth, 15), (self.btc, 11),
+        ]), [6, 110, None, 120, 5, 100])
+
+    def test_expiries_after_the_window_start(self):
+        # The price in force at the earliest expiry comes from before the scanned window
+        self.assertEqual(self.prices([(self.btc, 25), (self.btc, 26), (self.eth, 40)]), [110, 110, 6])
+
+
+class RecordingLayer:
+    def __init__(self):
+        self.sent = []
+
+    async def group_send(self, group, event):
+        self.sent.append((group, event))
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class LatestPriceTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('trader')
+        self.chart = ChartType.objects.create(name='Bitcoin', symbol='BTC')
+
+    def tick(self, price, stored=True):
+        data = {'type': 'message', 'chart_type': 'BTC', 'price': price, 'ts': int(time.time() * 1000)}
+        if stored:
+            data['_stored'] = True
+        return data
+
+    def test_only_stored_ticks_become_the_latest_price(self):
+        layer = RecordingLayer()
+        broadcaster = PriceBroadcaster(layer)
+        broadcaster.publish(self.tick('150'))
+        broadcaster.publish(self.tick('oops', stored=False))
+        broadcaster.publish({'type': 'status', 'chart_type': 'BTC'})
+        self.assertEqual(latest_price('BTC'), Decimal('150'))
+        # Rejected ticks are still forwarded, without the private flag
+        self.assertEqual(len(layer.sent), 3)
+        self.assertNotIn('_stored', layer.sent[1][1]['data'])
+
+    def test_conflated_flush_caches_the_last_stored_tick(self):
+        broadcaster = PriceBroadcaster(RecordingLayer(), rate=1)
+        broadcaster.publish(self.tick('150'))
+        broadcaster.publish(self.tick('oops', stored=False))
+        broadcaster.flush()
+        self.assertEqual(latest_price('BTC'), Decimal('150'))
+
+    def test_malformed_cache_entries_count_as_missing(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        for tick in ({'chart_type': 'BTC', 'price': 'oops'}, {'chart_type': 'BTC'}, {'chart_type': 'BTC', 'price': 'NaN'}):
+            cache.set(price_key('BTC'), {**tick, 'ts': int(time.time() * 1000)})
+            self.assertIsNone(latest_price('BTC', 10))
+            response = client.post('/api/bets/place/', {'chart_type_id': self.chart.id, 'amount': '1', 'direction': 'UP'})
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(client.get('/api/prices/latest/').json(), {})
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+    BET_BATCH_MAX=5,
+)
+class PlaceBatchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('trader')
+        self.btc = ChartType.objects.create(name='Bitcoin', symbol='BTC')
+        self.eth = ChartType.objects.create(name='Ethereum', symbol='ETH')  # no price
+        record_prices([{'type': 'message', 'chart_type': 'BTC', 'price': '150', 'ts': int(time.time() * 1000)}])
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def item(self, amount='10', chart=None, **extra):
+        return {'chart_type_id': (chart or self.btc).id, 'amount': amount, 'direction': 'UP', **extra}
+
+    def place(self, items):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post('/api/bets/place-batch/', items, format='json')
+
+    def balance(self):
+        return UserProfile.objects.get(user=self.user).balance
+
+    def notified(self):
+        layer = get_channel_layer()
+        ids = []
+        while True:
+            try:
+                message = async_to_sync(asyncio.wait_for)(layer.receive(SETTLEMENT_CHANNEL), 0.05)
+            except asyncio.TimeoutError:
+                return ids
+            ids += [bet_id for bet_id, _ in message['bets']]
+
+    def test_all_placed(self):
+        response = self.place([self.item('10'), self.item('15', timeframe=5)])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.data['placed'], response.data['rejected']), (2, 0))
+        self.assertEqual(self.balance(), 1000 - 25)
+
+        ids = [result['bet']['id'] for result in response.data['results']]
+        self.assertEqual(sorted(ids), sorted(Bet.objects.values_list('id', flat=True)))
+        self.assertEqual(sorted(self.notified()), sorted(ids))
+        bet = Bet.objects.get(id=ids[1])
+        self.assertEqual((bet.entry_price, bet.timeframe), (150, 5))
+        self.assertAlmostEqual(bet.expires_at - bet.created_at, timedelta(minutes=5), delta=timedelta(seconds=1))
+
+    def test_partial_failure(self):
+        response = self.place([
+            self.item('10'),
+            self.item('-1'),
+            self.item('10', chart=self.eth),
+            self.item('10', timeframe=-5),
+            self.item('20'),
+        ])
+        self.assertEqual(response.status_code, 207)
+        results = response.data['results']
+        self.assertEqual([r['index'] for r in results], list(range(5)))
+        self.assertEqual([r['status'] for r in results], ['placed', 'rejected', 'rejected', 'rejected', 'placed'])
+        self.assertIn('amount', results[1]['errors'])
+        self.assertIn('entry_price', results[2]['errors'])
+        self.assertIn('timeframe', results[3]['errors'])
+        self.assertEqual(self.balance(), 1000 - 30)
+        self.assertEqual(Bet.objects.count(), 2)
+        self.assertEqual(len(self.notified()), 2)
+
+    def test_total_is_debited_all_or_nothing(self):
+        response = self.place([self.item('600'), self.item('600')])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['placed'], 0)
+        for result in response.data['results']:
+            self.assertIn('amount', result['errors'])
+        self.assertEqual(self.balance(), 1000)
+        self.assertFalse(Bet.objects.exists())
+        self.assertEqual(self.notified(), [])
+
+    def test_malformed_requests(self):
+        for body in ({'chart_type_id': self.btc.id}, [], [self.item()] * 6):
+            self.assertEqual(self.place(body).status_code, 400)
+        response = self.place([self.item('0'), self.item(chart=self.eth)])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['rejected'], 2)
+        self.assertEqual(self.balance(), 1000)
+
+
+class LimitParamTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('trader')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_bet_page_size(self):
+        for limit in ('²', '-3', '0', 'x', '1e3'):
+            response = self.client.get('/api/bets/', {'limit': limit})
+            self.assertEqual(response.status_code, 200, limit)
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_candle_limit(self):
+        chart = ChartType.objects.create(name='Bitcoin', symbol='BTC')
+        for limit in ('²', '-3', '0', 'x', '1001'):
+            response = self.client.get('/api/candles/', {'chart_type': chart.id, 'limit': limit})
+            self.assertEqual(response.status_code, 400, limit)
+            self.assertIn('limit', response.json())
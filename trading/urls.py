@@ -23,4 +23,8 @@ urlpatterns = [
     path('login/', views.LoginView.as_view(), name='login'),
     path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     path('profile/', views.UserProfileView.as_view(), name='profile'),
+    path('prices/latest/', views.LatestPriceView.as_view(), name='latest-prices'),
+    path('export/ticks/', views.TickExportView.as_view(), name='export-ticks'),
+    path('export/candles/', views.CandleExportView.as_view(), name='export-candles'),
+    path('metrics/latency/', views.LatencyMetricsView.as_view(), name='latency-metrics'),
 ]
\ No newline at end of file
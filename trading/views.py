@@ -2,21 +2,38 @@
 from rest_framework.decorators import action
 from rest_framework import status, permissions
 from rest_framework.decorators import api_view
+from rest_framework.exceptions import ValidationError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import api_settings
 from rest_framework.response import Response
 from rest_framework.reverse import reverse
 from rest_framework.views import APIView
-from rest_framework.viewsets import ModelViewSet
+from rest_framework.viewsets import ModelViewSet, ReadOnlyModelViewSet
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth import authenticate
+from django.conf import settings
 from django.db import transaction
 import decimal
-from django.db.models import Sum
+import math
+from django.db.models import F
+from django.http import StreamingHttpResponse
 from django.utils import timezone
+from datetime import datetime, timedelta, timezone as dt_timezone
 from .serializers import (
     UserSerializer, UserProfileSerializer, ChartTypeSerializer,
     CandleSerializer, BetSerializer, ManualControlSerializer, CompletedBetSerializer
 )
-from .models import Candle, Bet, UserProfile, ChartType, ManualControl, CompletedBet
+from .models import Candle, Bet, BetStats, UserProfile, ChartType, ManualControl, CompletedBet
+from .httpcache import cached_response, candles_version, chart_types_version, etag_for, not_modified, response_key
+from .pagination import KeysetPagination
+from .registry import chart_types
+from .metrics import collect as collect_latency
+from .candles import parse_interval, query_candle_columns, query_candles
+from .export import (
+    CANDLE_COLUMNS, TICK_COLUMNS, CSVRenderer, NDJSONRenderer, async_chunks, candle_rows, export_stream, tick_rows,
+)
+from .snapshots import latest_price, latest_prices, tick_price
+from .scheduler import notify_bets
 
 
 @api_view(['GET'])
@@ -29,6 +46,10 @@ def api_root(request, format=None):
         'candles': reverse('candle-list', request=request, format=format),
         'bets': reverse('bet-list', request=request, format=format),
         'manual-controls': reverse('manual-control-list', request=request, format=format),
+        'latest-prices': reverse('latest-prices', request=request, format=format),
+        'latency-metrics': reverse('latency-metrics', request=request, format=format),
+        'export-ticks': reverse('export-ticks', request=request, format=format),
+        'export-candles': reverse('export-candles', request=request, format=format),
     })
 
 
@@ -74,82 +95,211 @@ class ChartTypeViewSet(ModelViewSet):
     serializer_class = ChartTypeSerializer
     permission_classes = [permissions.IsAuthenticated]
 
+    def list(self, request, *args, **kwargs):
+        version = chart_types_version()
+        if version is None:
+            return super().list(request, *args, **kwargs)
+
+        key = response_key('chart-types', version)
+        etag = etag_for(key)
+        if not_modified(request, etag):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+        data = cached_response(key, lambda: self.get_serializer(self.queryset.order_by('id'), many=True).data)
+        return Response(data, headers={'ETag': etag})
+
+class ColumnarRenderer(JSONRenderer):
+    """JSON selected by `?format=columnar`; the view then returns parallel arrays."""
+    format = 'columnar'
+
+
 class CandleViewSet(ModelViewSet):
+    """
+    `GET /candles/?chart_type=<id>&interval=15m&from=...&to=...&limit=30`
+
+    `interval` is any multiple of 5s ('90s', '15m', '4h', '1w' or seconds),
+    `from`/`to` are ISO 8601 or epoch seconds (`to` defaults to now) and the
+    newest `limit` candles of the range come back, newest first. Buckets
+    without trades have no candle, so `limit` counts candles, not time: with
+    gaps the candles reach further back than `limit` intervals. With
+    `format=columnar` the same candles come back oldest first as parallel
+    arrays (`time` in epoch seconds, `open`, `high`, `low`, `close`).
+    """
     serializer_class = CandleSerializer
     permission_classes = [permissions.AllowAny]
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, ColumnarRenderer]
+    queryset = Candle.objects.all()
 
-    def get_queryset(self):
-        chart_type_id = self.request.query_params.get('chart_type')
-        interval = self.request.query_params.get('interval', '5s')  # по умолчанию 5s
+    max_limit = 1000
 
+    def list(self, request, *args, **kwargs):
+        params = request.query_params
+        chart_type_id = params.get('chart_type')
         if not chart_type_id:
-            return Candle.objects.none()
-
-        # базовая выборка по активу
-        queryset = Candle.objects.filter(chart_type_id=chart_type_id).order_by('-time')
-
-        if interval == '5s':
-            return queryset[:30]  # обычный режим
-
-        # поддерживаемые интервалы
-        interval_map = {
-            '10s': 10,
-            '30s': 30,
-            '1m': 60,
-            '2m': 120,
-            '5m': 300,
-        }
-
-        if interval not in interval_map:
-            return queryset.none()  # неподдерживаемый
-
-        base_interval = 5  # ты генерируешь свечи каждые 5 секунд
-        target_interval = interval_map[interval]
-        group_size = target_interval // base_interval
-
-        raw_candles = list(queryset[:group_size * 30])
-        raw_candles = list(reversed(raw_candles))
-
-        aggregated = []
-        for i in range(0, len(raw_candles), group_size):
-            group = raw_candles[i:i+group_size]
-            if len(group) < group_size:
-                break
-
-            candle = {
-                'open_price': group[0].open_price,
-                'close_price': group[-1].close_price,
-                'min_price': min(c.min_price for c in group),
-                'max_price': max(c.max_price for c in group),
-                'time': group[-1].time,
-                'chart_type': group[-1].chart_type.id,
-            }
-            aggregated.append(candle)
-
-        # сериализуем как будто это обычные Candle
-        return Candle.objects.none()  # "обманываем DRF", вернём вручную
+            return Response([])
 
-    def list(self, request, *args, **kwargs):
-        queryset = self.get_queryset()
+        try:
+            chart_types.get_by_id(int(chart_type_id))
+        except (ValueError, ChartType.DoesNotExist):
+            return Response([])
 
-        if queryset.model != Candle:  # агрегированные свечи
-            return Response(queryset, status=status.HTTP_200_OK)
+        try:
+            interval = parse_interval(params.get('interval', '5s'))  # по умолчанию 5s
+        except ValueError as e:
+            raise ValidationError({'interval': str(e)})
+        start = parse_time(params, 'from')
+        end = parse_time(params, 'to') or timezone.now()
+        limit_error = ValidationError({'limit': f'Must be between 1 and {self.max_limit}'})
+        try:
+            limit = int(params.get('limit', '30'))
+        except ValueError:
+            raise limit_error
+        if not 0 < limit <= self.max_limit:
+            raise limit_error
+
+        columnar = request.accepted_renderer.format == ColumnarRenderer.format
+
+        def build():
+            if columnar:
+                columns = query_candle_columns(int(chart_type_id), interval, end, limit, start)
+                return {
+                    'chart_type': int(chart_type_id),
+                    'symbol': chart_types.get_by_id(int(chart_type_id)).symbol,
+                    'interval': interval,
+                    **columns,
+                }
+            candles = query_candles(int(chart_type_id), interval, end, limit, start)
+            return self.get_serializer(candles, many=True).data
+
+        # Ответ меняется только когда закрывается свеча (версия) или когда
+        # окно без `to` сдвигается на следующий интервал
+        version = candles_version(int(chart_type_id))
+        if version is None:
+            return Response(build())
+        window = params['to'] if 'to' in params else f"now{math.ceil(end.timestamp() / interval)}"
+        key = response_key(
+            'candles', int(chart_type_id), version, interval, params.get('from', ''), window, limit,
+            'columnar' if columnar else 'rows',
+        )
+        etag = etag_for(key)
+        if not_modified(request, etag):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+        return Response(cached_response(key, build), headers={'ETag': etag})
 
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
 
+def parse_time(params, name):
+    value = params.get(name)
+    if value is None:
+        return None
+    try:
+        if value.replace('.', '', 1).isdigit():
+            return datetime.fromtimestamp(float(value), tz=dt_timezone.utc)
+        parsed = datetime.fromisoformat(value)
+    except (ValueError, OverflowError, OSError):
+        raise ValidationError({name: 'Expected ISO 8601 or epoch seconds'})
+    return parsed if timezone.is_aware(parsed) else timezone.make_aware(parsed, dt_timezone.utc)
 
 
 class CompletedBetViewSet(ModelViewSet):
     serializer_class = CompletedBetSerializer
     permission_classes = [permissions.IsAuthenticated]
 
+    pagination_class = KeysetPagination
+
     def get_queryset(self):
-        queryset = CompletedBet.objects.filter(user=self.request.user).order_by('-created_at')
-        limit = self.request.query_params.get('limit')
-        if limit is not None and limit.isdigit():
-            queryset = queryset[:int(limit)]
-        return queryset
+        return CompletedBet.objects.filter(user=self.request.user).order_by('-created_at', '-id')
+
+
+class ExportView(APIView):
+    """
+    Streams a symbol's history over `from`/`to` (ISO 8601 or epoch seconds,
+    `to` defaults to now), oldest first, as NDJSON or, with `?format=csv`,
+    CSV. Rows are read through a server-side cursor and written out as they
+    come, so memory stays flat however long the range is, under WSGI and
+    ASGI alike.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    renderer_classes = [NDJSONRenderer, CSVRenderer]
+
+    name = None
+    columns = ()
+    # Row source: callable (chart, params, start, end) → rows, oldest first
+    rows = None
+
+    def get(self, request):
+        params = request.query_params
+        symbol = params.get('symbol')
+        if not symbol:
+            raise ValidationError({'symbol': 'This parameter is required'})
+        try:
+            chart = chart_types.get(symbol)
+        except ChartType.DoesNotExist:
+            raise ValidationError({'symbol': f'Unknown symbol {symbol!r}'})
+        start = parse_time(params, 'from')
+        end = parse_time(params, 'to') or timezone.now()
+        assert self.rows is not None, f"'{type(self).__name__}' should set `rows`"
+        rows = self.rows(chart, params, start, end)
+
+        fmt = request.accepted_renderer.format
+        body = export_stream(fmt, self.columns, rows)
+        if hasattr(request, 'scope'):
+            # Под daphne синхронный итератор был бы собран целиком до отправки
+            body = async_chunks(body)
+        response = StreamingHttpResponse(body, content_type=request.accepted_renderer.media_type)
+        response['Content-Disposition'] = f'attachment; filename="{chart.symbol}-{self.name}.{fmt}"'
+        return response
+
+
+def export_ticks(chart, params, start, end):
+    return tick_rows(chart.id, end, start)
+
+
+def export_candles(chart, params, start, end):
+    try:
+        interval = parse_interval(params.get('interval', '5s'))
+    except ValueError as e:
+        raise ValidationError({'interval': str(e)})
+    return candle_rows(chart.id, interval, end, start)
+
+
+class TickExportView(ExportView):
+    """`GET /export/ticks/?symbol=BTC&from=...&to=...&format=csv` — every PriceStamp."""
+    name = 'ticks'
+    columns = TICK_COLUMNS
+    rows = staticmethod(export_ticks)
+
+
+class CandleExportView(ExportView):
+    """`GET /export/candles/?symbol=BTC&interval=1m&from=...&to=...` — candles of any multiple of 5s."""
+    name = 'candles'
+    columns = CANDLE_COLUMNS
+    rows = staticmethod(export_candles)
+
+
+class LatencyMetricsView(APIView):
+    """Tick latency per pipeline stage and symbol, merged over all processes."""
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response(collect_latency())
+
+
+class LatestPriceView(APIView):
+    """Latest price of every symbol (or of `?symbols=A,B`), straight from the listener's cache."""
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request):
+        symbols = request.query_params.get('symbols')
+        if symbols:
+            symbols = [s.strip() for s in symbols.split(',') if s.strip()]
+        else:
+            symbols = [chart.symbol for chart in chart_types.all()]
+        prices = {}
+        for symbol, tick in latest_prices(symbols).items():
+            price = tick_price(tick)
+            if price is not None:
+                prices[symbol] = {'price': str(price), 'ts': tick.get('ts')}
+        return Response(prices)
 
 
 class UserProfileView(APIView):
@@ -174,13 +324,25 @@ class ManualControlViewSet(ModelViewSet):
         serializer.save()
 
 
-class BetViewSet(ModelViewSet):
+def debit(user, amount):
+    """
+    Take `amount` off the user's balance if it covers it, as one conditional
+    UPDATE. Returns whether the balance was debited.
+    """
+    return UserProfile.objects.filter(user=user, balance__gte=amount).update(
+        balance=F('balance') - amount
+    ) == 1
+
+
+class BetViewSet(ReadOnlyModelViewSet):
+    # Bets are only created through `place`/`place-batch`, which price and
+    # debit them, and are never edited or deleted by the client
     serializer_class = BetSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
-        print(self.request.user, "PIZDA")
-        return Bet.objects.filter(user=self.request.user).order_by('-created_at')
+        return Bet.objects.filter(user=self.request.user).order_by('-created_at', '-id')
 
     
     @action(detail=False, methods=['post'])
@@ -190,28 +352,31 @@ class BetViewSet(ModelViewSet):
         if not serializer.is_valid():
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
             
+        amount = serializer.validated_data['amount']
+        symbol = serializer.validated_data['chart_type'].symbol
+        entry_price = latest_price(symbol, settings.ENTRY_PRICE_MAX_AGE)
+        if entry_price is None:
+            return Response({
+                'error': 'Price unavailable',
+                'detail': f'No recent price for {symbol}, try again later'
+            }, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
         try:
             with transaction.atomic():
-                user_profile = request.user.userprofile
-                amount = serializer.validated_data['amount']
-
-                # Проверяем баланс
-                if user_profile.balance < amount:
+                # Списываем баланс одним условным UPDATE — без чтения и гонок
+                if not debit(request.user, amount):
+                    balance = UserProfile.objects.filter(user=request.user).values_list('balance', flat=True).first()
                     return Response({
                         'error': 'Insufficient balance',
-                        'detail': f'Your current balance ({user_profile.balance}) is less than the bet amount ({amount})'
+                        'detail': f'Your current balance ({balance}) is less than the bet amount ({amount})'
                     }, status=status.HTTP_400_BAD_REQUEST)
 
                 # Создаем ставку
-                bet = serializer.save()
-                
-                # Обновляем баланс пользователя
-                user_profile.balance -= amount
-                user_profile.save()
+                bet = serializer.save(entry_price=entry_price)
 
-                # Получаем свежий сериализатор для ответа
-                response_serializer = self.get_serializer(bet)
-                return Response(response_serializer.data, status=status.HTTP_201_CREATED)
+            # Получаем свежий сериализатор для ответа
+            response_serializer = self.get_serializer(bet)
+            return Response(response_serializer.data, status=status.HTTP_201_CREATED)
 
         except Exception as e:
             return Response({
@@ -219,15 +384,95 @@ class BetViewSet(ModelViewSet):
                 'detail': str(e)
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+    @action(detail=False, methods=['post'], url_path='place-batch')
+    def place_batch(self, request):
+        """
+        Place a list of bets in one request.
+
+        Every item is validated and priced on its own; invalid or unpriced
+        items are rejected with their errors and don't affect the others. The
+        summed amount of the remaining items is debited in one update: if the
+        balance doesn't cover all of them, none is placed. Responds 201 when
+        every item was placed, 207 when some were and 400 when none was, with
+        one result per item in request order.
+        """
+        items = request.data
+        if not isinstance(items, list) or not items:
+            return Response({'error': 'Expected a non-empty list of bets'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > settings.BET_BATCH_MAX:
+            return Response({
+                'error': 'Batch too large',
+                'detail': f'At most {settings.BET_BATCH_MAX} bets per request'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        results = [None] * len(items)
+        valid = []  # (index, validated_data)
+        for index, item in enumerate(items):
+            serializer = self.get_serializer(data=item)
+            if serializer.is_valid():
+                valid.append((index, serializer.validated_data))
+            else:
+                results[index] = {'index': index, 'status': 'rejected', 'errors': serializer.errors}
+
+        # Цены всех символов пачки одним запросом к кэшу
+        ticks = latest_prices({data['chart_type'].symbol for _, data in valid})
+        now = timezone.now()
+        bets = []
+        for index, data in valid:
+            symbol = data['chart_type'].symbol
+            entry_price = tick_price(ticks.get(symbol), settings.ENTRY_PRICE_MAX_AGE)
+            if entry_price is None:
+                results[index] = {
+                    'index': index, 'status': 'rejected',
+                    'errors': {'entry_price': [f'No recent price for {symbol}']},
+                }
+                continue
+            bet = Bet(user=request.user, entry_price=entry_price, **data)
+            # bulk_create skips Bet.save, which fills expires_at
+            bet.expires_at = now + timedelta(minutes=bet.timeframe)
+            bets.append((index, bet))
+
+        if bets:
+            total = sum(bet.amount for _, bet in bets)
+            with transaction.atomic():
+                debited = debit(request.user, total)
+                if debited:
+                    Bet.objects.bulk_create([bet for _, bet in bets])
+                    notify_bets([bet for _, bet in bets])
+
+            for index, bet in bets:
+                if debited:
+                    results[index] = {'index': index, 'status': 'placed', 'bet': self.get_serializer(bet).data}
+                else:
+                    results[index] = {
+                        'index': index, 'status': 'rejected',
+                        'errors': {'amount': [f'Insufficient balance for the batch total ({total})']},
+                    }
+
+        placed = sum(1 for result in results if result['status'] == 'placed')
+        if placed == len(items):
+            response_status = status.HTTP_201_CREATED
+        elif placed:
+            response_status = status.HTTP_207_MULTI_STATUS
+        else:
+            response_status = status.HTTP_400_BAD_REQUEST
+        return Response({
+            'placed': placed,
+            'rejected': len(items) - placed,
+            'results': results,
+        }, status=response_status)
+
     @action(detail=False, methods=['get'])
     def statistics(self, request):
-        bets = self.get_queryset()
-        total_profit = bets.filter(result='WIN').aggregate(Sum('amount'))['amount__sum'] or 0
-        total_loss = bets.filter(result='LOSS').aggregate(Sum('amount'))['amount__sum'] or 0
-        
+        stats = BetStats.objects.filter(user=request.user).first() or BetStats(user=request.user)
+        # Settled bets leave the Bet table, so this counts only open bets
+        pending = Bet.objects.filter(user=request.user, result='PENDING').count()
+
         return Response({
-            'total_profit': str(total_profit),
-            'total_loss': str(total_loss),
-            'total_bets': bets.count(),
-            'pending_bets': bets.filter(result='PENDING').count()
+            'total_profit': str(stats.total_profit),
+            'total_loss': str(stats.total_loss),
+            'total_bets': stats.wins + stats.losses + pending,
+            'pending_bets': pending,
+            'wins': stats.wins,
+            'losses': stats.losses,
         })
\ No newline at end of file